@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from pidog import Pidog
+from pidog.gait_engine import GaitEngine
 from time import sleep
 from vilib import Vilib
 from preset_actions import bark
@@ -9,6 +10,7 @@ my_dog = Pidog()
 sleep(0.1)
 
 STEP = 0.5
+LOOKAHEAD = 3 # frames queued ahead of the servos, steering reacts within them
 
 def delay(time):
     my_dog.wait_legs_done()
@@ -26,6 +28,10 @@ def ball_track():
     pitch = 0
     flag = False
     direction = 0
+    # steer continuously instead of switching between the forward and turn tables
+    gait = GaitEngine('walk')
+    gait_frames = (Pidog.legs_angle_calculation(coords) for coords in gait)
+    walking = False
 
     my_dog.do_action('stand', speed=50)
     my_dog.head_move([[yaw, 0, pitch]], immediately=True, speed=80)
@@ -58,16 +64,20 @@ def ball_track():
         if width == 0:
             pitch = 0
             yaw = 0
-        elif width < 300:
-            if my_dog.is_legs_done():
-                if yaw < -30:
-                    print("turn right")
-                    my_dog.do_action('turn_right', speed=98)
-                elif yaw > 30:
-                    print("turn left")
-                    my_dog.do_action('turn_left', speed=98)
-                else:
-                    my_dog.do_action('forward', speed=98)
+        if 0 < width < 300:
+            # head yaw > 0: ball on the left, turn left
+            gait.command(vx=1, vyaw=max(-1, min(1, yaw / 60)))
+            if not walking:
+                gait.reset()
+                my_dog.legs_stream(gait_frames, lookahead=LOOKAHEAD, speed=98)
+                walking = True
+        elif walking:
+            # finish the current section, all the feet end on the ground
+            my_dog.stop_stream('legs')
+            if gait.step != 0:
+                my_dog.legs_move(Pidog.legs_angle_calculation_batch(gait.next_section()),
+                                 immediately=False, speed=98)
+            walking = False
         sleep(0.02)
 
 
@@ -14,7 +14,7 @@ DANGER_DISTANCE = 15
 stand = my_dog.legs_angle_calculation([[0, 80], [0, 80], [30, 75], [30, 75]])
 
 def patrol():
-    distance = round(my_dog.read_distance(), 2)
+    distance = my_dog.read_distance()
     print(f"distance: {distance} cm", end="", flush=True)
 
     # danger
@@ -31,12 +31,15 @@ def patrol():
         bark(my_dog, [head_yaw, 0, 0])
 
         while distance < DANGER_DISTANCE:
-            distance = round(my_dog.read_distance(), 2)
+            # block until the next reading instead of polling
+            reading = my_dog.wait_distance(timeout=1)
+            if reading is None:
+                continue
+            distance = reading[0]
             if distance < DANGER_DISTANCE:
                 print(f"distance: {distance} cm \033[0;31m DANGER !\033[m")
             else:
                 print(f"distance: {distance} cm", end="", flush=True)
-            time.sleep(0.01)
     # safe
     else:
         print("")
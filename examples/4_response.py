@@ -31,18 +31,18 @@ def alert():
     my_dog.do_action('stand', step_count=1, speed=70)
     my_dog.rgb_strip.set_mode('breath', color='pink', bps=1, brightness=0.8)
     while True:
+        distance = my_dog.read_distance()
         print(
-            f'distance.value: {round(my_dog.read_distance(), 2)} cm, touch {my_dog.dual_touch.read()}')
+            f'distance.value: {distance} cm, touch {my_dog.dual_touch.read()}')
         # alert
-        if my_dog.read_distance() < 15 and my_dog.read_distance() > 1:
+        if distance < 15 and distance > 1:
             my_dog.head_move([[0, 0, 0]], immediately=True, speed=90)
             my_dog.tail_move([[0]], immediately=True, speed=80)
             my_dog.rgb_strip.set_mode('bark', color='red', bps=2, brightness=0.8)
             my_dog.do_action('backward', step_count=1, speed=95)
             my_dog.wait_all_done()
             lean_forward()
-            while len(my_dog.legs_action_buffer) > 0:
-                sleep(0.1)
+            my_dog.wait_legs_done()
             my_dog.do_action('stand', step_count=1, speed=90)
             sleep(0.5)
         # relax
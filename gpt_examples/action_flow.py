@@ -163,16 +163,16 @@ class ActionFlow():
             if self.current_status != self.STATUS_STAND:
                 sit_2_stand(self.dog_obj, speed=75) # speed > 70
             else:
-               self.dog_obj.do_action('stand', speed=self.CHANGE_STATUS_SPEED) 
+               self.dog_obj.transition('stand', speed=self.CHANGE_STATUS_SPEED) 
         elif status == self.STATUS_SIT:
             self.set_head_pitch_init(self.SIT_HEAD_PITCH)
-            self.dog_obj.do_action('sit', speed=self.CHANGE_STATUS_SPEED)
+            self.dog_obj.transition('sit', speed=self.CHANGE_STATUS_SPEED, space='foot')
         elif status == self.STATUS_LIE:
             self.set_head_pitch_init(self.STAND_HEAD_PITCH)
-            self.dog_obj.do_action('lie', speed=self.CHANGE_STATUS_SPEED)
+            self.dog_obj.transition('lie', speed=self.CHANGE_STATUS_SPEED)
         
+        # the blend is queued, the next action follows it without waiting
         self.current_status = status
-        self.dog_obj.wait_all_done()
 
 
     def run(self, action):
@@ -1,12 +1,14 @@
 from openai_helper import OpenAiHelper
 from keys import OPENAI_API_KEY, OPENAI_ASSISTANT_ID
 from action_flow import ActionFlow
+from preset_actions import ACTION_TABLES
 from utils import *
 
 import readline # optimize keyboard input, only need to import
 
 import speech_recognition as sr
 from pidog import Pidog
+from pidog.action_library import ActionLibrary
 
 import time
 import threading
@@ -51,7 +53,8 @@ VOICE_ACTIONS = ["bark", "bark harder", "pant",  "howling"]
 # dog init 
 # =================================================================
 try:
-    my_dog = Pidog()
+    # actions and preset tables precompiled in ~/.config/pidog/actions.bin
+    my_dog = Pidog(action_library=ActionLibrary(extra=ACTION_TABLES))
     time.sleep(1)
 except Exception as e:
     raise RuntimeError(e)
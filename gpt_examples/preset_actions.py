@@ -4,6 +4,19 @@ import random
 from math import sin, cos, pi
 
 
+def preset_angles(my_dog, function, *args):
+    '''
+    Angles table of a preset, from the action library of my_dog if it was
+    compiled with these arguments (see ACTION_TABLES), otherwise computed
+    '''
+    library = my_dog.actions_dict.library
+    if library is not None:
+        data = library.get(f'{function.__name__}{args}')
+        if data is not None:
+            return data[0]
+    return function(*args)
+
+
 def scratch(my_dog):
     h1 = [[0, 0, -40]]
     h2 = [[30, 70, -10]]
@@ -124,24 +137,33 @@ def body_twisting(my_dog):
     my_dog.wait_all_done()
 
 
+def bark_legs_angles():
+    from pidog import Pidog
+    # lean back, then forward
+    return [
+        Pidog.legs_angle_calculation(
+            [[0, 100], [0, 100], [30, 90], [30, 90]]),
+        Pidog.legs_angle_calculation(
+            [[-20, 90], [-20, 90], [0, 90], [0, 90]]),
+    ]
+
+
 def bark_action(my_dog, yrp=None, speak=None, volume=100):
     if yrp is None:
         yrp = [0, 0, 0]
     h1 = [0 + yrp[0], 0 + yrp[1], 20 + yrp[2]]
     h2 = [0 + yrp[0], 0 + yrp[1],  0 + yrp[2]]
 
-    f1 = my_dog.legs_angle_calculation(
-        [[0, 100], [0, 100], [30, 90], [30, 90]])
-    f2 = my_dog.legs_angle_calculation(
-        [[-20, 90], [-20, 90], [0, 90], [0, 90]])
+    f1, f2 = preset_angles(my_dog, bark_legs_angles)
 
     if speak is not None:
         my_dog.speak(speak, volume)
-    my_dog.legs_move([f1], immediately=True, speed=85)
+    # after the frames already queued, eg. the blend of a status change
+    my_dog.legs_move([f1], immediately=False, speed=85)
     my_dog.head_move([h1], immediately=True, speed=85)
     my_dog.wait_all_done()
     sleep(0.01)
-    my_dog.legs_move([f2], immediately=True, speed=85)
+    my_dog.legs_move([f2], immediately=False, speed=85)
     my_dog.head_move([h2], immediately=True, speed=85)
     my_dog.wait_all_done()
     sleep(0.01)
@@ -159,7 +181,7 @@ def shake_head(my_dog, yrp=None):
     my_dog.wait_all_done()
 
 
-def shake_head_smooth(my_dog, pitch_comp=0, amplitude=40, speed=90):
+def shake_head_smooth_angles(pitch_comp=0, amplitude=40):
     y = 0
     r = 0
     p = 0
@@ -170,7 +192,11 @@ def shake_head_smooth(my_dog, pitch_comp=0, amplitude=40, speed=90):
         r = 0
         p = pitch_comp
         angs.append([y, r, p])
+    return angs
+
 
+def shake_head_smooth(my_dog, pitch_comp=0, amplitude=40, speed=90):
+    angs = preset_angles(my_dog, shake_head_smooth_angles, pitch_comp, amplitude)
     my_dog.head_move_raw(angs, speed=speed)
     my_dog.wait_all_done()
 
@@ -223,10 +249,9 @@ def howling(my_dog, volume=100):
 
 
 def attack_posture(my_dog):
-    f2 = my_dog.legs_angle_calculation(
-        [[-20, 90], [-20, 90], [0, 90], [0, 90]]
-        )
-    my_dog.legs_move([f2], immediately=True, speed=85)
+    f2 = preset_angles(my_dog, bark_legs_angles)[1]
+    # after the blend of a status change, if any
+    my_dog.legs_move([f2], immediately=False, speed=85)
     my_dog.wait_legs_done()
     sleep(0.01)
 
@@ -325,21 +350,13 @@ def feet_shake(my_dog, step=None):
     
 def sit_2_stand(my_dog, speed=75):
 
-    sit_angles = my_dog.actions_dict['sit'][0][0]
-    stand_angles = my_dog.actions_dict['stand'][0][0]
-
     L1 = [25, 25, -25, -25, 70, -25, -70, 25]
 
-    legs_action = [
-        # sit_angles,
-        L1,
-        stand_angles,
-    ]
-    
-    my_dog.legs_move(legs_action, immediately=False, speed=speed)
-    my_dog.wait_legs_done()
+    # blend from the current pose through L1 to stand, the feet move on
+    # straight lines, queued without waiting
+    my_dog.transition('stand', speed=speed, space='foot', via=[L1])
 
-def relax_neck(my_dog, pitch_comp=-35):
+def relax_neck_angles(pitch_comp=-35):
 
     y_ang = 0
     r_ang = 0
@@ -351,7 +368,11 @@ def relax_neck(my_dog, pitch_comp=-35):
         r_ang = round(45*sin(pi/10*i), 2)
         p_ang = round(20*sin(pi/10*i-pi/2) + pitch_comp, 2)
         turn_neck_angs.append([y_ang, r_ang, p_ang])
+    return turn_neck_angs
+
+def relax_neck(my_dog, pitch_comp=-35):
 
+    turn_neck_angs = preset_angles(my_dog, relax_neck_angles, pitch_comp)
     my_dog.head_move_raw(turn_neck_angs, speed=80)
     
     my_dog.wait_all_done()
@@ -384,7 +405,7 @@ def relax_neck(my_dog, pitch_comp=-35):
     my_dog.wait_all_done()
 
 
-def nod(my_dog, pitch_comp=-35, amplitude=20, step=2, speed=90):
+def nod_angles(pitch_comp=-35, amplitude=20, step=2):
     y = 0
     r = 0
     p = 0
@@ -395,7 +416,10 @@ def nod(my_dog, pitch_comp=-35, amplitude=20, step=2, speed=90):
         r = 0
         p = round(amplitude*cos(pi/10*i) - amplitude + pitch_comp, 2)
         angs.append([y, r, p])
+    return angs
 
+def nod(my_dog, pitch_comp=-35, amplitude=20, step=2, speed=90):
+    angs = preset_angles(my_dog, nod_angles, pitch_comp, amplitude, step)
     my_dog.head_move_raw(angs, speed=speed)
     my_dog.wait_all_done()
 
@@ -551,6 +575,31 @@ def stretch(my_dog):
     my_dog.head_move_raw([[0, 0, -35]], immediately=False, speed=68)
     my_dog.wait_all_done()
 
+def _table(function, args, part):
+    def table():
+        return function(*args), part
+    return table
+
+# computed tables of the presets, with the arguments of ActionFlow (standing
+# and sitting head pitch), compiled with:
+#   python3 -m pidog.action_library preset_actions.py
+# the other presets move through literal angles lists, or actions of
+# ActionDict (push_up, sit ...), already compiled, the blend of sit_2_stand
+# is cached by Pidog.transitions
+ACTION_TABLES = {
+    f'{function.__name__}{args}': _table(function, args, part)
+    for function, args, part in [
+        (bark_legs_angles, (), 'legs'),
+        (relax_neck_angles, (0,), 'head'),
+        (relax_neck_angles, (-35,), 'head'),
+        (nod_angles, (0, 20, 2), 'head'),
+        (nod_angles, (-35, 20, 2), 'head'),
+        (shake_head_smooth_angles, (0, 40), 'head'),
+        (shake_head_smooth_angles, (-35, 40), 'head'),
+    ]
+}
+
+
 if __name__ == "__main__":
     from pidog import Pidog
     import readchar
@@ -2,6 +2,7 @@ import asyncio
 import websockets
 import json
 from pidog import Pidog
+from pidog.async_pidog import AsyncPidog
 from vilib import Vilib
 import time
 import os
@@ -28,14 +29,19 @@ logger = setup_logging()
 
 # Global variables
 my_dog = None
+async_dog = None # asyncio facade of my_dog, never blocks the event loop
 server = None
 is_running = True
+background_tasks = set() # running commands, kept referenced until done
 
 # Head control variables
 head_yrp = [0, 0, 0]
 head_pitch_init = 0
 HEAD_SPEED = 80
 
+# action command limits
+MAX_STEP_COUNT = 20
+
 def cleanup():
     global my_dog, is_running
     logger.info("Cleaning up resources...")
@@ -63,26 +69,26 @@ def getIP():
     eth0 = os.popen("ifconfig eth0 |awk '/inet/'|awk 'NR==1 {print $2}'").readline().strip('\n')
     return wlan0 if wlan0 != '' else eth0
 
-async def welcome_sequence(my_dog):
+async def welcome_sequence(dog):
     try:
         logger.info("Starting welcome sequence")
-        my_dog.do_action('sit', speed=80)
+        await dog.do_action('sit', speed=80)
         await asyncio.sleep(1)
         
-        my_dog.rgb_strip.set_mode('breath', color='green', bps=1.0)
-        my_dog.speak('pasha', 100)
-        await asyncio.sleep(1)
+        dog.rgb_strip.set_mode('breath', color='green', bps=1.0)
+        await dog.speak('pasha', 100)
         
-        my_dog.rgb_strip.set_mode('breath', color='blue', bps=1.0)
-        hand_shake(my_dog)
+        # the preset actions block, run them off the event loop
+        dog.rgb_strip.set_mode('breath', color='blue', bps=1.0)
+        await dog.run(hand_shake, dog.dog)
         await asyncio.sleep(1)
         
-        my_dog.rgb_strip.set_mode('breath', color='red', bps=1.0)
-        high_five(my_dog)
+        dog.rgb_strip.set_mode('breath', color='red', bps=1.0)
+        await dog.run(high_five, dog.dog)
         await asyncio.sleep(1)
         
-        my_dog.rgb_strip.set_mode('breath', color='yellow', bps=0.5)
-        my_dog.do_action('sit', speed=80)
+        dog.rgb_strip.set_mode('breath', color='yellow', bps=0.5)
+        await dog.do_action('sit', speed=80)
         await asyncio.sleep(1)
         
         return True
@@ -90,6 +96,43 @@ async def welcome_sequence(my_dog):
         logger.error(f"Error during welcome sequence: {e}")
         return False
 
+def action_args(action_data):
+    '''
+    step_count and speed of an action command, clamped to 1..MAX_STEP_COUNT
+    and 0..100, raises ValueError if they are not numbers
+    '''
+    step_count = action_data.get('step_count', 1)
+    speed = action_data.get('speed', 80)
+    for value in (step_count, speed):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"Invalid value: {value!r}")
+    step_count = min(max(int(step_count), 1), MAX_STEP_COUNT)
+    speed = min(max(int(speed), 0), 100)
+    return step_count, speed
+
+def run_in_background(coro, websocket, command):
+    '''
+    Run a command without blocking the next messages of the client,
+    an error is logged and sent to the client when the command ends
+    '''
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+
+    def done(task):
+        background_tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        e = task.exception()
+        logger.error(f"Error in {command} command: {e}")
+        asyncio.ensure_future(websocket.send(json.dumps({
+            'status': 'error',
+            'command': command,
+            'message': str(e)
+        })))
+
+    task.add_done_callback(done)
+    return task
+
 async def handle_command(websocket, path):
     try:
         async for message in websocket:
@@ -112,8 +155,10 @@ async def handle_command(websocket, path):
                         head_yrp[1] = roll
                         head_yrp[2] = pitch
                         
-                        my_dog.head_move([head_yrp], pitch_comp=head_pitch_init,
-                                       immediately=True, speed=HEAD_SPEED)
+                        # do not wait for the head, the next position may already be coming
+                        run_in_background(async_dog.head_move([head_yrp], pitch_comp=head_pitch_init,
+                                                             immediately=True, speed=HEAD_SPEED),
+                                          websocket, 'head_move')
                         
                     except Exception as e:
                         logger.error(f"Error in head movement: {e}")
@@ -124,7 +169,8 @@ async def handle_command(websocket, path):
                             'status': 'success',
                             'command': 'welcome'
                         }))
-                        await welcome_sequence(my_dog)
+                        # the next messages are handled while the dog moves
+                        run_in_background(welcome_sequence(async_dog), websocket, 'welcome')
                     except Exception as e:
                         logger.error(f"Error in welcome sequence: {e}")
                         await websocket.send(json.dumps({
@@ -139,7 +185,8 @@ async def handle_command(websocket, path):
                             'status': 'success',
                             'command': 'sit'
                         }))
-                        my_dog.do_action('sit', speed=80)
+                        # the next messages are handled while the dog moves
+                        run_in_background(async_dog.do_action('sit', speed=80), websocket, 'sit')
                     except Exception as e:
                         logger.error(f"Error in sit command: {e}")
                         await websocket.send(json.dumps({
@@ -154,7 +201,8 @@ async def handle_command(websocket, path):
                             'status': 'success',
                             'command': 'stand'
                         }))
-                        my_dog.do_action('stand', speed=80)
+                        # the next messages are handled while the dog moves
+                        run_in_background(async_dog.do_action('stand', speed=80), websocket, 'stand')
                     except Exception as e:
                         logger.error(f"Error in stand command: {e}")
                         await websocket.send(json.dumps({
@@ -163,6 +211,40 @@ async def handle_command(websocket, path):
                             'message': str(e)
                         }))
 
+                elif command_type == 'list_actions':
+                    await websocket.send(json.dumps({
+                        'status': 'success',
+                        'command': 'list_actions',
+                        'actions': my_dog.actions_dict.list_actions()
+                    }))
+
+                elif command_type == 'action':
+                    action_data = data.get('data', {})
+                    name = action_data.get('name', '')
+                    # validate against the action registry, never evaluate client strings
+                    if not my_dog.actions_dict.has_action(name):
+                        await websocket.send(json.dumps({
+                            'status': 'error',
+                            'command': 'action',
+                            'message': f"Unknown action: {name}"
+                        }))
+                        continue
+                    try:
+                        step_count, speed = action_args(action_data)
+                    except (TypeError, ValueError, OverflowError) as e:
+                        await websocket.send(json.dumps({
+                            'status': 'error',
+                            'command': 'action',
+                            'message': str(e)
+                        }))
+                        continue
+                    await websocket.send(json.dumps({
+                        'status': 'success',
+                        'command': 'action'
+                    }))
+                    run_in_background(async_dog.do_action(name, step_count=step_count, speed=speed),
+                                      websocket, 'action')
+
             except json.JSONDecodeError as e:
                 logger.error(f"Error decoding message: {e}")
                 await websocket.send(json.dumps({
@@ -182,7 +264,7 @@ async def handle_command(websocket, path):
         logger.error(f"Unexpected error: {e}")
 
 async def main():
-    global my_dog, server, is_running
+    global my_dog, async_dog, server, is_running
     
     try:
         # Set up signal handlers
@@ -192,6 +274,7 @@ async def main():
         # Initialize PiDog
         logger.info("Initializing PiDog")
         my_dog = Pidog()
+        async_dog = AsyncPidog(my_dog)
         time.sleep(0.5)
         
         # Start video stream
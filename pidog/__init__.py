@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
-from .pidog import Pidog
-from robot_hat import utils
-from time import sleep
 from .version import __version__
 
+def __getattr__(name):
+    # import Pidog on first use, so that subprocesses importing a submodule
+    # (eg. pidog.sensory_worker) do not load the whole robot
+    if name == 'Pidog':
+        from .pidog import Pidog
+        return Pidog
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def __main__():
+    from .backend import RobotHatBackend
     print(f"Thanks for using Pidog {__version__} ! woof, woof, woof !")
-    utils.reset_mcu()
-    sleep(0.2)
\ No newline at end of file
+    RobotHatBackend().reset_mcu()
\ No newline at end of file
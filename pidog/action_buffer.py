@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+import threading
+from collections import deque
+
+
+class ActionBuffer():
+    """
+    Frame queue for the legs, head and tail action threads
+
+    deque backed, O(1) append / pop at both ends, with a condition variable
+    so that consumers block until frames arrive and waiters get notified when
+    all frames are finished.
+    """
+
+    def __init__(self, maxlen=None):
+        """
+        :param maxlen: max number of queued frames, the oldest frames are dropped when full, None for unlimited
+        :type maxlen: int
+        """
+        self.maxlen = maxlen
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self._frames = deque()
+        self.moving = False # a frame has been taken out and is being executed
+        self.closed = False
+        self.listeners = [] # threading.Event objects set when frames are added
+        self._done_callbacks = [] # one shot callbacks, called when all frames are finished
+        # statistics
+        self.pushed = 0
+        self.popped = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, index):
+        return self._frames[index]
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    def extend(self, frames):
+        """
+        Append frames to the end of the queue
+
+        :param frames: list of frames, or a 2d numpy array of precomputed angles
+        :type frames: list or numpy.ndarray
+        :return: number of frames dropped because the queue is full
+        :rtype: int
+        """
+        if hasattr(frames, 'tolist'):
+            frames = frames.tolist()
+        with self.cond:
+            self._frames.extend(frames)
+            self.pushed += len(frames)
+            dropped = 0
+            if self.maxlen is not None:
+                while len(self._frames) > self.maxlen:
+                    self._frames.popleft()
+                    dropped += 1
+                self.dropped += dropped
+            self.cond.notify_all()
+        for event in self.listeners:
+            event.set()
+        return dropped
+
+    def append(self, frame):
+        return self.extend([frame])
+
+    def add_listener(self, event):
+        """
+        Set event whenever frames are added, for consumers that wait on
+        several buffers at once
+
+        :param event: event to set
+        :type event: threading.Event
+        """
+        self.listeners.append(event)
+
+    def get(self, timeout=None):
+        """
+        Take the first frame out of the queue, block until one is available
+
+        The frame is marked as moving until task_done() is called.
+
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: the frame, None on timeout or if the buffer is closed
+        :rtype: list
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self._frames or self.closed, timeout):
+                return None
+            if self.closed:
+                return None
+            self.moving = True
+            self.popped += 1
+            frame = self._frames.popleft()
+            # room for producers waiting in wait_space
+            self.cond.notify_all()
+            return frame
+
+    def pop_many(self, count):
+        """
+        Take up to count frames out of the queue without blocking
+
+        :param count: max number of frames
+        :type count: int
+        :return: list of frames
+        :rtype: list
+        """
+        with self.cond:
+            count = min(count, len(self._frames))
+            frames = [self._frames.popleft() for _ in range(count)]
+            self.popped += count
+            if count:
+                self.cond.notify_all()
+            callbacks = self._take_done_callbacks()
+        self._call(callbacks)
+        return frames
+
+    def task_done(self):
+        """
+        Mark the frame returned by get() as finished
+        """
+        with self.cond:
+            self.moving = False
+            self.cond.notify_all()
+            callbacks = self._take_done_callbacks()
+        self._call(callbacks)
+
+    def clear(self):
+        """
+        Drop all queued frames, the moving frame is not affected
+
+        :return: number of frames dropped
+        :rtype: int
+        """
+        with self.cond:
+            dropped = len(self._frames)
+            self._frames.clear()
+            self.dropped += dropped
+            self.cond.notify_all()
+            callbacks = self._take_done_callbacks()
+        self._call(callbacks)
+        return dropped
+
+    def is_done(self):
+        return len(self._frames) == 0 and not self.moving
+
+    def wait_space(self, limit, timeout=None, cancel=None):
+        """
+        Block until fewer than limit frames are queued
+
+        :param limit: number of frames
+        :type limit: int
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :param cancel: function, stop waiting when it returns True, checked
+            when the condition is notified
+        :type cancel: function
+        :return: True if there is room, False on timeout, cancel or if the buffer is closed
+        :rtype: bool
+        """
+        cancelled = cancel if cancel is not None else lambda: False
+        with self.cond:
+            if not self.cond.wait_for(
+                    lambda: len(self._frames) < limit or self.closed or cancelled(), timeout):
+                return False
+            return not self.closed and not cancelled()
+
+    def wait_done(self, timeout=None):
+        """
+        Block until the queue is empty and the last frame is finished
+
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: True if done, False on timeout
+        :rtype: bool
+        """
+        with self.cond:
+            return self.cond.wait_for(self.is_done, timeout)
+
+    def add_done_callback(self, callback):
+        """
+        Call callback() once, as soon as the queue is empty and the last
+        frame is finished, right away if it already is. It is called from
+        the thread that finishes the frame and should return quickly, eg.
+        hand the result over to an event loop.
+
+        :param callback: function without arguments
+        :type callback: function
+        """
+        with self.cond:
+            done = self.is_done()
+            if not done:
+                self._done_callbacks.append(callback)
+        if done:
+            callback()
+
+    def remove_done_callback(self, callback):
+        with self.cond:
+            if callback in self._done_callbacks:
+                self._done_callbacks.remove(callback)
+
+    def _take_done_callbacks(self):
+        # with the lock held
+        if not self._done_callbacks or not self.is_done():
+            return []
+        callbacks, self._done_callbacks = self._done_callbacks, []
+        return callbacks
+
+    @staticmethod
+    def _call(callbacks):
+        # without the lock held, callbacks may use the buffer
+        for callback in callbacks:
+            callback()
+
+    def open(self):
+        with self.cond:
+            self.closed = False
+
+    def close(self):
+        """
+        Wake up and release all consumers blocked in get()
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        """
+        Queue statistics, to see the backlog of a controller
+
+        :return: depth, pushed, popped and dropped frame counts
+        :rtype: dict
+        """
+        with self.cond:
+            return {
+                'depth': len(self._frames),
+                'pushed': self.pushed,
+                'popped': self.popped,
+                'dropped': self.dropped,
+            }
+
+
+class ActionStream():
+    """
+    Feed an ActionBuffer from an iterator of frames, with a bounded lookahead
+
+    A feeder thread pulls the next frame only when fewer than lookahead
+    frames are queued, so a long or endless action takes constant memory
+    and a change in the iterator (eg. a new gait command) reaches the
+    servos after at most lookahead frames.
+    """
+
+    LOOKAHEAD = 3
+    POLL = 0.1 # seconds, to check the buffer while it is full
+
+    def __init__(self, buffer, frames, push, lookahead=LOOKAHEAD):
+        """
+        :param buffer: ActionBuffer to feed
+        :type buffer: ActionBuffer
+        :param frames: iterable of frames
+        :param push: function queueing one frame, eg. lambda frame: dog.legs_move([frame], immediately=False)
+        :type push: function
+        :param lookahead: max number of queued frames
+        :type lookahead: int
+        """
+        if lookahead < 1:
+            raise ValueError("lookahead must be at least 1")
+        self.buffer = buffer
+        self.frames = iter(frames)
+        self.push = push
+        self.lookahead = lookahead
+        self.count = 0 # frames pushed
+        self.error = None # exception raised by the iterator
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(name='action_stream_thread', target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if not self.buffer.wait_space(self.lookahead, self.POLL, self._stopping.is_set):
+                if self.buffer.closed:
+                    break
+                continue
+            if self._stopping.is_set():
+                break
+            try:
+                frame = next(self.frames)
+            except StopIteration:
+                break
+            except Exception as e:
+                self.error = e
+                break
+            self.push(frame)
+            self.count += 1
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def stop(self, clear=True):
+        """
+        Stop feeding
+
+        :param clear: also drop the frames already queued
+        :type clear: bool
+        """
+        self._stopping.set()
+        # wake the feeder up if it waits for room in the buffer
+        with self.buffer.cond:
+            self.buffer.cond.notify_all()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        if clear:
+            self.buffer.clear()
+
+    def join(self, timeout=None):
+        """
+        Wait until the iterator is exhausted and pushed
+        """
+        self._thread.join(timeout)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+'''
+Precompiled actions
+
+The actions of ActionDict (the gaits solved with the inverse kinematics,
+doze_off, the head sine tables ...) are computed in python on every access.
+ActionLibrary compiles them once into a binary file: a json header, then
+all the tables concatenated in one float64 array, memory-mapped on load,
+each action a (rows, columns) slice of it at the offset given by the header.
+
+The header carries the format version and a hash of everything the tables
+depend on: the signature (size and modification time) of the modules
+computing them, the height, barycenter and steps of the gaits. A file with
+another version or hash, or that can not be read, is stale: the tables are
+computed again and the file rewritten.
+
+Other tables can be compiled in the same file with extra, a dict of
+name -> function returning (frames, part), eg. the ACTION_TABLES of
+gpt_examples/preset_actions.py:
+
+    python3 -m pidog.action_library [path] [extra_module.py ...]
+
+builds the file, extra modules are scanned for an ACTION_TABLES dict.
+'''
+import os
+import sys
+import json
+import hashlib
+import importlib.util
+import numpy as np
+from .version import __version__
+
+
+class ActionLibrary():
+    """
+    Actions tables memory-mapped from a file, computed again when the file is stale
+    """
+
+    VERSION = 2 # file format version
+    MAGIC = b'PIDOGACT'
+    DTYPE = '<f8'
+    # modules computing the tables
+    SOURCES = ('actions_dictionary.py', 'walk.py', 'trot.py', 'pidog.py')
+    FILE_NAME = 'actions.bin'
+
+    def __init__(self, path=None, extra=None):
+        """
+        :param path: library file, default see default_path
+        :type path: str
+        :param extra: more tables, name -> function returning (frames, part)
+        :type extra: dict
+        """
+        self.path = path if path is not None else self.default_path()
+        self.extra = dict(extra or {})
+        self.tables = {} # name -> (numpy.ndarray, part), views of data
+        self.data = None # all the tables, mapped from the file once loaded
+        self._lists = {} # name -> (frames as lists, part), converted on first use
+        self.params = None
+        self.digest = None
+        self.loaded = False # tables read from the file
+        self.built = False # tables computed
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def default_path(cls):
+        """
+        :return: actions.bin next to pidog.conf, in the home of the user
+            running pidog, also under sudo
+        :rtype: str
+        """
+        from .pidog import config_file
+        return os.path.join(os.path.dirname(config_file), cls.FILE_NAME)
+
+    @staticmethod
+    def params_of(actions_dict):
+        """
+        Parameters the tables depend on, besides the sources
+
+        :param actions_dict: ActionDict
+        :return: barycenter, height and gait steps
+        :rtype: tuple
+        """
+        from .walk import Walk
+        from .trot import Trot
+        return (actions_dict.barycenter, actions_dict.height,
+                Walk.LEG_STEP_WIDTH, Walk.LEG_STEP_HEIGHT,
+                Trot.LEG_STEP_WIDTH, Trot.LEG_STEP_HEIGHT)
+
+    def hash(self, params):
+        """
+        :param params: see params_of
+        :type params: tuple
+        :return: hash of the sources signatures, the extra tables and the parameters
+        :rtype: str
+        """
+        here = os.path.dirname(os.path.abspath(__file__))
+        files = {os.path.join(here, name) for name in self.SOURCES}
+        files.update(os.path.abspath(function.__code__.co_filename)
+                     for function in self.extra.values())
+        # like the python bytecode cache, size and modification time stand
+        # for the content, without reading the sources
+        sources = []
+        for path in sorted(files):
+            stat = os.stat(path)
+            sources.append([path, stat.st_size, stat.st_mtime_ns])
+        key = [self.VERSION, __version__, list(params), sources, sorted(self.extra)]
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def _table(self, name, frames):
+        try:
+            frames = np.array(frames, dtype=self.DTYPE)
+        except ValueError:
+            raise ValueError(f"action {name}: frames of different lengths") from None
+        if frames.ndim != 2:
+            raise ValueError(f"action {name}: frames must be a list of lists of angles")
+        return frames
+
+    def compile(self, actions_dict):
+        """
+        Compute all the tables, the library of actions_dict is not used
+
+        :param actions_dict: ActionDict
+        :raises ValueError: if a table is not a list of frames of the same length
+        """
+        tables = {}
+        for name in actions_dict.list_actions():
+            frames, part = actions_dict.ACTIONS[name](actions_dict)
+            tables[name] = (self._table(name, frames), part)
+        for name, function in self.extra.items():
+            frames, part = function()
+            tables[name] = (self._table(name, frames), part)
+        self.tables = tables
+        self.data = None
+        self._lists = {}
+        self.params = self.params_of(actions_dict)
+        self.digest = self.hash(self.params)
+        self.built = True
+        self.loaded = False
+
+    def save(self, path=None):
+        """
+        Write the tables, atomically
+        """
+        path = path or self.path
+        entries = {}
+        arrays = []
+        offset = 0
+        for name in sorted(self.tables):
+            frames, part = self.tables[name]
+            rows, columns = frames.shape
+            entries[name] = [part, offset, rows, columns]
+            arrays.append(frames.reshape(-1))
+            offset += frames.size
+        header = json.dumps({
+            'version': self.VERSION,
+            'hash': self.digest,
+            'params': list(self.params),
+            'tables': entries,
+        }).encode()
+        # align the data on 8 bytes
+        header += b' ' * (-(len(self.MAGIC) + 4 + len(header)) % 8)
+        data = np.concatenate(arrays) if arrays else np.zeros(0)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(len(header).to_bytes(4, 'little'))
+            f.write(header)
+            f.write(data.astype(self.DTYPE).tobytes())
+        os.replace(tmp, path)
+
+    def load(self, actions_dict, path=None):
+        """
+        Map the tables, if the file matches the current sources and parameters
+
+        :param actions_dict: ActionDict
+        :return: True if loaded, False if missing, unreadable or stale
+        :rtype: bool
+        """
+        path = path or self.path
+        params = self.params_of(actions_dict)
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    return False
+                size = int.from_bytes(f.read(4), 'little')
+                header = json.loads(f.read(size))
+            if header.get('version') != self.VERSION:
+                return False
+            digest = self.hash(params)
+            if header.get('hash') != digest:
+                return False
+            offset = len(self.MAGIC) + 4 + size
+            data = None
+            if os.path.getsize(path) > offset:
+                # plain ndarray view of the mapping, cheaper to slice than a memmap
+                data = np.asarray(np.memmap(path, dtype=self.DTYPE, mode='r', offset=offset))
+            tables = {}
+            for name, (part, start, rows, columns) in header['tables'].items():
+                frames = data[start:start + rows * columns].reshape(rows, columns) \
+                    if rows else np.zeros((0, 0))
+                tables[name] = (frames, part)
+        except Exception:
+            # missing, truncated or corrupted file
+            return False
+        self.tables = tables
+        self.data = data
+        self._lists = {}
+        self.params = params
+        self.digest = digest
+        self.loaded = True
+        self.built = False
+        return True
+
+    def open(self, actions_dict, save=True):
+        """
+        Load the file, or compile the tables and write it if it is stale
+
+        :param actions_dict: ActionDict
+        :param save: write the file after compiling
+        :type save: bool
+        :return: self
+        :rtype: ActionLibrary
+        """
+        if not self.load(actions_dict):
+            self.compile(actions_dict)
+            if save:
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f'\033[0;33maction library not saved: {e}\033[0m')
+        return self
+
+    def get(self, name):
+        """
+        Frames of an action, like ActionDict[name]
+
+        :param name: action name, normalized
+        :type name: str
+        :return: frames and part, None if not compiled
+        :rtype: tuple
+        """
+        entry = self._lists.get(name)
+        if entry is None:
+            table = self.tables.get(name)
+            if table is None:
+                self.misses += 1
+                return None
+            entry = self._lists[name] = (table[0].tolist(), table[1])
+        self.hits += 1
+        # shallow copy, the table itself must not be changed by caller
+        return list(entry[0]), entry[1]
+
+    @property
+    def nbytes(self):
+        return sum(frames.nbytes for frames, _ in self.tables.values())
+
+    def stats(self):
+        """
+        :return: tables, bytes, loaded or built, hits and misses
+        :rtype: dict
+        """
+        return {
+            'tables': len(self.tables),
+            'bytes': self.nbytes,
+            'loaded': self.loaded,
+            'built': self.built,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def build(path=None, extra=None):
+    """
+    Compile the actions of ActionDict, and the extra tables, into path
+
+    :return: the library
+    :rtype: ActionLibrary
+    """
+    from .actions_dictionary import ActionDict
+    library = ActionLibrary(path, extra)
+    library.compile(ActionDict())
+    library.save()
+    return library
+
+
+def load_tables(module_path):
+    """
+    ACTION_TABLES dict of a python file
+    """
+    name = os.path.splitext(os.path.basename(module_path))[0]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(module_path)))
+    spec = importlib.util.spec_from_file_location(name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, 'ACTION_TABLES', {})
+
+
+def main():
+    args = sys.argv[1:]
+    path = None
+    if args and not args[0].endswith('.py'):
+        path = args.pop(0)
+    extra = {}
+    for module_path in args:
+        extra.update(load_tables(module_path))
+    library = build(path, extra)
+    stats = library.stats()
+    print(f"{stats['tables']} actions, {stats['bytes']} bytes -> {library.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,27 +3,148 @@ from .pidog import Pidog
 from .walk import Walk
 from .trot import Trot
 from math import sin
+from collections import OrderedDict
+
+class ActionNotFoundError(KeyError):
+    """Raised when an action name is not registered in ActionDict"""
+    pass
 
 # ActionDict: - > angles_dict
 class ActionDict(dict):
 
+    # action name -> property getter, filled in once at import (see bottom of file)
+    ACTIONS = {}
+
+    GAIT_CACHE_SIZE = 16 # max number of gait angle tables kept in cache
+
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
         super().__init__()
         self.barycenter = -15
         self.height = 95
+        self._gait_cache = OrderedDict()
+        # precompiled tables, see use_library
+        self.library = None
+        self._library_valid = None
 
     def __getitem__(self, item):
-        return eval("self.%s" % item.replace(" ", "_"))
+        try:
+            name = self.normalize_name(item)
+            getter = self.ACTIONS[name]
+        except (KeyError, AttributeError):
+            raise ActionNotFoundError(item)
+        if self.library is not None:
+            if self._library_valid is None:
+                # checked again after a change of height or barycenter
+                self._library_valid = self.library.params == self.library.params_of(self)
+            if self._library_valid:
+                data = self.library.get(name)
+                if data is not None:
+                    return data
+        return getter(self)
+
+    def __contains__(self, item):
+        return self.has_action(item)
+
+    @staticmethod
+    def normalize_name(name):
+        """
+        Normalize an action name alias, eg: "Turn left" -> "turn_left"
+        """
+        return name.strip().lower().replace(" ", "_")
+
+    @classmethod
+    def has_action(cls, name):
+        try:
+            return cls.normalize_name(name) in cls.ACTIONS
+        except AttributeError:
+            return False
+
+    @classmethod
+    def list_actions(cls):
+        """
+        List all registered action names
+
+        :return: sorted action names
+        :rtype: list
+        """
+        return sorted(cls.ACTIONS)
+
+    def iter_action(self, name, step_count=None):
+        """
+        Frames of an action, one at a time, instead of step_count copies of the table
+
+        :param name: action name
+        :type name: str
+        :param step_count: number of repetitions, None to repeat forever
+        :type step_count: int
+        :return: frames iterator and part, 'legs', 'head' or 'tail'
+        :rtype: tuple
+        """
+        actions, part = self[name]
+
+        def frames():
+            step = 0
+            while step_count is None or step < step_count:
+                yield from actions
+                step += 1
+        return frames(), part
 
     def set_height(self, height):
         if height in range(20, 95):
+            if height != self.height:
+                self.clear_gait_cache()
             self.height = height
 
     def set_barycenter(self, offset):
         if offset in range(-60, 60):
+            if offset != self.barycenter:
+                self.clear_gait_cache()
             self.barycenter = offset
 
+    def clear_gait_cache(self):
+        self._gait_cache.clear()
+        self._library_valid = None
+
+    def use_library(self, library):
+        """
+        Serve the actions from precompiled tables while the height, the
+        barycenter and the gait steps are the ones they were compiled with,
+        call clear_gait_cache() after changing the steps of Walk or Trot
+
+        :param library: opened library, None to compute the actions again
+        :type library: pidog.action_library.ActionLibrary
+        """
+        self.library = library
+        self._library_valid = None
+
+    def gait_angles(self, gait, fb, lr):
+        """
+        Get the angles table of a gait, computed once and then cached (LRU)
+
+        :param gait: gait class, Walk or Trot
+        :type gait: class
+        :param fb: FORWARD(1) or BACKWARD(-1)
+        :type fb: int
+        :param lr: LEFT(-1), STRAIGHT(0) or RIGHT(1)
+        :type lr: int
+        :return: list of legs angles
+        :rtype: list
+        """
+        key = (gait.__name__, fb, lr, self.barycenter, self.height,
+               gait.LEG_STEP_WIDTH, gait.LEG_STEP_HEIGHT)
+        data = self._gait_cache.get(key)
+        if data is None:
+            coords = gait(fb, lr).get_coords()
+            data = Pidog.legs_angle_calculation_batch(coords).tolist()
+            self._gait_cache[key] = data
+            if len(self._gait_cache) > self.GAIT_CACHE_SIZE:
+                self._gait_cache.popitem(last=False)
+        else:
+            self._gait_cache.move_to_end(key)
+        # shallow copy, the cached table itself must not be changed by caller
+        return list(data)
+
     # 站 stand
     @property
     def stand(self):
@@ -58,52 +179,27 @@ class ActionDict(dict):
     # forward
     @property
     def forward(self):
-        data = []
-        forward = Walk(fb=Walk.FORWARD, lr=Walk.STRAIGHT)
-        coords = forward.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
-        return data, 'legs'
+        return self.gait_angles(Walk, Walk.FORWARD, Walk.STRAIGHT), 'legs'
 
     # backward
     @property
     def backward(self):
-        data = []
-        backward = Walk(fb=Walk.BACKWARD, lr=Walk.STRAIGHT)
-        coords = backward.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
-        return data, 'legs'
+        return self.gait_angles(Walk, Walk.BACKWARD, Walk.STRAIGHT), 'legs'
 
     # turn_left
     @property
     def turn_left(self):
-        data = []
-        turn_left = Walk(fb=Walk.FORWARD, lr=Walk.LEFT)
-        coords = turn_left.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
-        return data, 'legs'
+        return self.gait_angles(Walk, Walk.FORWARD, Walk.LEFT), 'legs'
 
     # turn_right
     @property
     def turn_right(self):
-        data = []
-        turn_right = Walk(fb=Walk.FORWARD, lr=Walk.RIGHT)
-        coords = turn_right.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
-        return data, 'legs'
+        return self.gait_angles(Walk, Walk.FORWARD, Walk.RIGHT), 'legs'
 
     # 小跑 trot
     @property
     def trot(self):
-        data = []
-        trot = Trot(Trot.FORWARD, Trot.STRAIGHT)
-        coords = trot.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
-        return data, 'legs'
+        return self.gait_angles(Trot, Trot.FORWARD, Trot.STRAIGHT), 'legs'
 
     # 伸懒腰 stretch
     @property
@@ -254,3 +350,8 @@ class ActionDict(dict):
         return [
             [25, 25, -25, -25, 64, -45, -64, 45],
         ], 'legs'
+
+ActionDict.ACTIONS = {
+    name: attr.fget for name, attr in vars(ActionDict).items()
+    if isinstance(attr, property)
+}
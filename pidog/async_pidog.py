@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+'''
+asyncio facade for Pidog
+
+Pidog methods either queue frames and return, or block the calling thread
+until the frames are finished. AsyncPidog queues the same frames and returns
+an awaitable instead: the action threads resolve it through
+ActionBuffer.add_done_callback and loop.call_soon_threadsafe, so the event
+loop never blocks and many coroutines can drive the robot at once.
+
+    from pidog import Pidog
+    from pidog.async_pidog import AsyncPidog
+
+    async def main():
+        dog = AsyncPidog(Pidog())
+        await dog.do_action('stand', speed=80)
+        async for distance, t in dog.sensor_updates('distance'):
+            ...
+
+Other attributes are the ones of the wrapped Pidog, so dog.rgb_strip or
+dog.read_distance() still work. Blocking routines (eg. the preset actions of
+a script) can be awaited with run().
+'''
+import asyncio
+import functools
+
+
+class AsyncPidog():
+    """
+    Awaitable actions and async sensor iterators on top of a Pidog
+    """
+
+    SENSOR_POLL = 0.01 # seconds between two checks of a sensor bus field
+
+    def __init__(self, dog):
+        """
+        :param dog: the Pidog to drive
+        :type dog: Pidog
+        """
+        self.dog = dog
+        self._buffers = {
+            'legs': dog.legs_action_buffer,
+            'head': dog.head_action_buffer,
+            'tail': dog.tail_action_buffer,
+        }
+
+    def __getattr__(self, name):
+        # everything else is the synchronous Pidog api
+        return getattr(self.dog, name)
+
+    def done(self, part):
+        """
+        Future resolved when a part finished all its queued frames
+
+        :param part: 'legs', 'head' or 'tail'
+        :type part: str
+        :return: future, resolved with True
+        :rtype: asyncio.Future
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def set_result():
+            if not future.done():
+                future.set_result(True)
+
+        def callback():
+            # called from the action thread
+            loop.call_soon_threadsafe(set_result)
+
+        buffer = self._buffers[part]
+        buffer.add_done_callback(callback)
+        # on timeout or cancel, do not keep the callback in the buffer
+        future.add_done_callback(lambda f: buffer.remove_done_callback(callback))
+        return future
+
+    async def _wait(self, parts, timeout):
+        futures = [self.done(part) for part in parts]
+        try:
+            await asyncio.wait_for(asyncio.gather(*futures), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def do_action(self, action_name, step_count=1, speed=50, pitch_comp=0, lookahead=None, timeout=None):
+        """
+        Queue an action and wait until its part finished moving
+
+        :param action_name: action name, see ActionDict.list_actions
+        :type action_name: str
+        :param lookahead: stream the frames, see Pidog.do_action, with
+            step_count None it never finishes, use a timeout
+        :type lookahead: int
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: True if done, False on timeout or unknown action
+        :rtype: bool
+        """
+        part = self.dog.do_action(action_name, step_count=step_count, speed=speed, pitch_comp=pitch_comp,
+                                  lookahead=lookahead)
+        if part is None:
+            return False
+        return await self._wait([part], timeout)
+
+    # immediately: stop the stream of the part and drop the queued frames,
+    # without waiting for the moving one like Pidog does, the action thread
+    # finishes it before the new frames
+
+    async def legs_move(self, target_angles, immediately=True, speed=50, timeout=None):
+        if immediately:
+            self.dog.stop_stream('legs')
+            self._buffers['legs'].clear()
+        self.dog.legs_move(target_angles, immediately=False, speed=speed)
+        return await self._wait(['legs'], timeout)
+
+    async def head_move(self, target_yrps, roll_comp=0, pitch_comp=0, immediately=True, speed=50, timeout=None):
+        if immediately:
+            self.dog.stop_stream('head')
+            self._buffers['head'].clear()
+        self.dog.head_move(target_yrps, roll_comp=roll_comp, pitch_comp=pitch_comp,
+                           immediately=False, speed=speed)
+        return await self._wait(['head'], timeout)
+
+    async def tail_move(self, target_angles, immediately=True, speed=50, timeout=None):
+        if immediately:
+            self.dog.stop_stream('tail')
+            self._buffers['tail'].clear()
+        self.dog.tail_move(target_angles, immediately=False, speed=speed)
+        return await self._wait(['tail'], timeout)
+
+    async def wait_legs_done(self, timeout=None):
+        return await self._wait(['legs'], timeout)
+
+    async def wait_head_done(self, timeout=None):
+        return await self._wait(['head'], timeout)
+
+    async def wait_tail_done(self, timeout=None):
+        return await self._wait(['tail'], timeout)
+
+    async def wait_all_done(self, timeout=None):
+        """
+        Wait until legs, head and tail finished all their queued frames
+
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: True if done, False on timeout
+        :rtype: bool
+        """
+        return await self._wait(['legs', 'head', 'tail'], timeout)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking function in the default executor and await it,
+        eg. await dog.run(hand_shake, dog.dog)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def speak(self, name, volume=100):
+        """
+        Play a sound and wait until it finished
+
+        :param name: the file name int the folder(SOUND_DIR)
+        :type name: str
+        :param volume: volume, 0-100
+        :type volume: int
+        """
+        return await self.run(self.dog.speak_block, name, volume)
+
+    async def sensor_updates(self, field, poll=SENSOR_POLL):
+        """
+        Iterate over the new values of a sensor bus field
+
+        :param field: field name, see SensorBus.FIELDS
+        :type field: str
+        :param poll: seconds between two checks
+        :type poll: float
+        :return: async iterator of (value, timestamp)
+        """
+        bus = self.dog.sensor_bus
+        seq = bus.read_record(field)[2]
+        while True:
+            await asyncio.sleep(poll)
+            value, t, current = bus.read_record(field)
+            if current != seq:
+                seq = current
+                yield value, t
+
+    async def _events(self, source, maxsize):
+        # source calls its callbacks from its irq thread
+        loop = asyncio.get_running_loop()
+        q = asyncio.Queue(maxsize)
+
+        def put(item):
+            if not q.full():
+                q.put_nowait(item)
+
+        def callback(*event):
+            loop.call_soon_threadsafe(put, event)
+
+        source.add_callback(callback)
+        try:
+            while True:
+                yield await q.get()
+        finally:
+            source.remove_callback(callback)
+
+    def touch_events(self, maxsize=0):
+        """
+        Iterate over the touch gestures, needs Pidog(touch_events=True)
+
+        :return: async iterator of (time, gesture)
+        """
+        return self._events(self.dog.dual_touch, maxsize)
+
+    def sound_events(self, maxsize=0):
+        """
+        Iterate over the sound directions, needs Pidog(sound_events=True)
+
+        :return: async iterator of (time, angle)
+        """
+        return self._events(self.dog.ears, maxsize)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+'''
+Attitude estimation from the SH3001 accelerometer and gyroscope
+
+Angles follow Pidog's convention: the imu x axis points down when the robot
+stands level (ax = -16384 at rest), pitch is the tilt towards y and roll the
+tilt towards z, both in degrees and equal to Pidog's accelerometer only
+pitch / roll when the robot is still.
+
+Quaternions are [w, x, y, z], rotating body vectors to a frame whose z axis
+points up, yaw is not observable without a magnetometer and is left free.
+
+Estimators can run sample by sample (update) from the imu thread, or on a
+whole log of samples at once (update_batch, process).
+'''
+import threading
+from math import sqrt, radians
+import numpy as np
+
+
+ACC_LSB_PER_G = 16384 # 2g range, set by Sh3001.sh3001_init
+GYRO_LSB_PER_DPS = 16.4 # 2000 dps range, set by Sh3001.sh3001_init
+
+
+def accel_angles(acc):
+    """
+    Pitch and roll from accelerometer samples, same formulas as Pidog._imu_thread
+
+    :param acc: n*3 accelerometer samples, any unit
+    :type acc: numpy.ndarray
+    :return: pitch and roll arrays, degrees
+    :rtype: tuple
+    """
+    acc = np.asarray(acc, dtype=float).reshape(-1, 3)
+    ax = acc[:, 0]
+    ay = -acc[:, 1]
+    az = -acc[:, 2]
+    pitch = np.degrees(np.arctan2(ay, np.sqrt(ax*ax + az*az)))
+    roll = np.degrees(np.arctan2(az, np.sqrt(ax*ax + ay*ay)))
+    return pitch, roll
+
+
+def up_from_angles(pitch, roll):
+    """
+    Unit vector pointing up, in the body frame, inverse of accel_angles
+
+    :return: n*3 array
+    :rtype: numpy.ndarray
+    """
+    uy = -np.sin(np.radians(pitch))
+    uz = -np.sin(np.radians(roll))
+    ux = -np.sqrt(np.clip(1 - uy*uy - uz*uz, 0, None))
+    return np.stack([ux, uy, uz], axis=-1)
+
+
+def quaternion_from_up(up):
+    """
+    Shortest rotation taking the body up vector to z
+
+    :param up: n*3 unit vectors
+    :return: n*4 quaternions
+    :rtype: numpy.ndarray
+    """
+    up = np.asarray(up, dtype=float).reshape(-1, 3)
+    # q = [1 + up.z, up x z], normalized
+    q = np.stack([1 + up[:, 2], up[:, 1], -up[:, 0], np.zeros(len(up))], axis=-1)
+    norm = np.linalg.norm(q, axis=1)
+    # up pointing straight down, any horizontal axis will do
+    flipped = norm < 1e-9
+    q[flipped] = [0, 1, 0, 0]
+    norm[flipped] = 1
+    return q / norm[:, None]
+
+
+def up_from_quaternion(q):
+    """
+    Body frame up vector of quaternions, inverse of quaternion_from_up
+
+    :param q: n*4 quaternions
+    :return: n*3 unit vectors
+    :rtype: numpy.ndarray
+    """
+    q = np.asarray(q, dtype=float).reshape(-1, 4)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    # third row of the rotation matrix
+    return np.stack([2*(x*z - w*y), 2*(y*z + w*x), w*w - x*x - y*y + z*z], axis=-1)
+
+
+def linear_recurrence(a, u, x0, block=64):
+    """
+    x[k] = a[k] * x[k-1] + u[k], vectorized by blocks
+
+    :param a: n (or n*m) factors, 0 < a <= 1
+    :param u: n (or n*m) inputs
+    :param x0: state before the first sample
+    :param block: samples per block, keeps the cumulated products well
+        conditioned
+    :type block: int
+    :return: n (or n*m) states
+    :rtype: numpy.ndarray
+    """
+    out = np.empty_like(u, dtype=float)
+    x = np.asarray(x0, dtype=float)
+    for start in range(0, len(u), block):
+        p = np.cumprod(a[start:start + block], axis=0)
+        out[start:start + block] = p * (x + np.cumsum(u[start:start + block] / p, axis=0))
+        x = out[start + len(p) - 1]
+    return out
+
+
+class AttitudeEstimator():
+    """
+    Base class, keeps the latest estimate behind a lock
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.t = None
+        self.pitch = 0.0
+        self.roll = 0.0
+        self.yaw_rate = 0.0
+        self.quaternion = [1.0, 0.0, 0.0, 0.0]
+
+    def reset(self):
+        with self.lock:
+            self.t = None
+
+    def snapshot(self):
+        """
+        Latest estimate
+
+        :return: t, roll, pitch (degrees), yaw_rate (degrees/s, positive to
+            the left) and quaternion
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                't': self.t,
+                'roll': self.roll,
+                'pitch': self.pitch,
+                'yaw_rate': self.yaw_rate,
+                'quaternion': list(self.quaternion),
+            }
+
+    def update(self, t, acc, gyro):
+        """
+        Add one sample
+
+        :param t: timestamp, seconds
+        :type t: float
+        :param acc: [ax, ay, az] raw accelerometer data, offset corrected
+        :type acc: list
+        :param gyro: [gx, gy, gz] raw gyroscope data, offset corrected
+        :type gyro: list
+        """
+        self.update_batch([t], [acc], [gyro])
+
+    def update_batch(self, t, acc, gyro):
+        """
+        Add n samples, continuing from the current state
+
+        :param t: n timestamps, seconds
+        :param acc: n*3 raw accelerometer data
+        :param gyro: n*3 raw gyroscope data
+        :return: pitch, roll, yaw_rate arrays (degrees, degrees/s) and n*4 quaternions
+        :rtype: tuple
+        """
+        raise NotImplementedError
+
+    def process(self, t, acc, gyro):
+        """
+        Estimate a whole log of samples from scratch, eg. offline
+
+        :return: same as update_batch
+        :rtype: tuple
+        """
+        self.reset()
+        return self.update_batch(t, acc, gyro)
+
+    @staticmethod
+    def _yaw_rate(up, gyro):
+        # rotation rate around the vertical axis
+        return np.sum(up * np.asarray(gyro, dtype=float).reshape(-1, 3), axis=1) / GYRO_LSB_PER_DPS
+
+    def _store(self, t, pitch, roll, yaw_rate, q):
+        with self.lock:
+            self.t = float(t[-1])
+            self.pitch = float(pitch[-1])
+            self.roll = float(roll[-1])
+            self.yaw_rate = float(yaw_rate[-1])
+            self.quaternion = q[-1].tolist()
+
+
+class ComplementaryFilter(AttitudeEstimator):
+    """
+    Complementary filter, per axis
+
+    The gyro rate is integrated and pulled towards the accelerometer angle
+    with the time constant tau. The recursion is linear, so batches are
+    computed with numpy.
+    """
+
+    def __init__(self, tau=0.5, pitch_gyro_axis=2, pitch_gyro_sign=-1,
+                 roll_gyro_axis=1, roll_gyro_sign=1):
+        """
+        :param tau: time constant, seconds, longer trusts the gyro more
+        :type tau: float
+        :param pitch_gyro_axis: gyro axis index of the pitch rate
+        :type pitch_gyro_axis: int
+        :param pitch_gyro_sign: 1 or -1
+        :type pitch_gyro_sign: int
+        :param roll_gyro_axis: gyro axis index of the roll rate
+        :type roll_gyro_axis: int
+        :param roll_gyro_sign: 1 or -1
+        :type roll_gyro_sign: int
+        """
+        super().__init__()
+        self.tau = tau
+        self.pitch_gyro_axis = pitch_gyro_axis
+        self.pitch_gyro_sign = pitch_gyro_sign
+        self.roll_gyro_axis = roll_gyro_axis
+        self.roll_gyro_sign = roll_gyro_sign
+
+    def update_batch(self, t, acc, gyro):
+        t = np.asarray(t, dtype=float).reshape(-1)
+        gyro = np.asarray(gyro, dtype=float).reshape(-1, 3)
+        acc_angles = np.stack(accel_angles(acc), axis=-1) # pitch, roll
+        rates = np.stack([
+            self.pitch_gyro_sign * gyro[:, self.pitch_gyro_axis],
+            self.roll_gyro_sign * gyro[:, self.roll_gyro_axis],
+        ], axis=-1) / GYRO_LSB_PER_DPS
+
+        with self.lock:
+            last_t = self.t
+            state = [self.pitch, self.roll]
+        if last_t is None:
+            # start on the accelerometer
+            last_t = t[0]
+            state = acc_angles[0]
+        dt = np.diff(t, prepend=last_t)
+        a = (self.tau / (self.tau + dt))[:, None].repeat(2, axis=1)
+        u = a * rates * dt[:, None] + (1 - a) * acc_angles
+        angles = linear_recurrence(a, u, state)
+
+        pitch, roll = angles[:, 0], angles[:, 1]
+        up = up_from_angles(pitch, roll)
+        yaw_rate = self._yaw_rate(up, gyro)
+        q = quaternion_from_up(up)
+        self._store(t, pitch, roll, yaw_rate, q)
+        return pitch, roll, yaw_rate, q
+
+
+class MadgwickFilter(AttitudeEstimator):
+    """
+    Madgwick gradient descent filter, imu version (no magnetometer)
+
+    Works on the full 3d orientation, so it needs no axis mapping, only
+    that the gyro and the accelerometer share the same axes.
+    """
+
+    def __init__(self, beta=0.1):
+        """
+        :param beta: gradient step, higher trusts the accelerometer more
+        :type beta: float
+        """
+        super().__init__()
+        self.beta = beta
+
+    def step(self, q, gyro, acc, dt):
+        """
+        One filter step
+
+        :param q: [w, x, y, z] current quaternion
+        :param gyro: rad/s
+        :param acc: normalized accelerometer, pointing up
+        :return: new quaternion
+        :rtype: list
+        """
+        q0, q1, q2, q3 = q
+        gx, gy, gz = gyro
+        # rate of change from the gyro
+        qd0 = 0.5 * (-q1*gx - q2*gy - q3*gz)
+        qd1 = 0.5 * (q0*gx + q2*gz - q3*gy)
+        qd2 = 0.5 * (q0*gy - q1*gz + q3*gx)
+        qd3 = 0.5 * (q0*gz + q1*gy - q2*gx)
+
+        ax, ay, az = acc
+        if ax != 0 or ay != 0 or az != 0:
+            # gradient of the gravity direction error
+            s0 = 4*q0*q2*q2 + 2*q2*ax + 4*q0*q1*q1 - 2*q1*ay
+            s1 = (4*q1*q3*q3 - 2*q3*ax + 4*q0*q0*q1 - 2*q0*ay - 4*q1
+                  + 8*q1*q1*q1 + 8*q1*q2*q2 + 4*q1*az)
+            s2 = (4*q0*q0*q2 + 2*q0*ax + 4*q2*q3*q3 - 2*q3*ay - 4*q2
+                  + 8*q2*q1*q1 + 8*q2*q2*q2 + 4*q2*az)
+            s3 = 4*q1*q1*q3 - 2*q1*ax + 4*q2*q2*q3 - 2*q2*ay
+            norm = sqrt(s0*s0 + s1*s1 + s2*s2 + s3*s3)
+            if norm > 0:
+                qd0 -= self.beta * s0 / norm
+                qd1 -= self.beta * s1 / norm
+                qd2 -= self.beta * s2 / norm
+                qd3 -= self.beta * s3 / norm
+
+        q0 += qd0 * dt
+        q1 += qd1 * dt
+        q2 += qd2 * dt
+        q3 += qd3 * dt
+        norm = sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+        return [q0/norm, q1/norm, q2/norm, q3/norm]
+
+    def update_batch(self, t, acc, gyro):
+        t = np.asarray(t, dtype=float).reshape(-1)
+        acc = np.asarray(acc, dtype=float).reshape(-1, 3)
+        gyro = np.asarray(gyro, dtype=float).reshape(-1, 3)
+        # unit vectors and rad/s for all samples at once, the recursion
+        # itself is not linear and runs sample by sample
+        acc_norm = np.linalg.norm(acc, axis=1)
+        acc_unit = np.divide(acc, acc_norm[:, None], out=np.zeros_like(acc),
+                             where=acc_norm[:, None] > 0)
+        gyro_rad = gyro * radians(1) / GYRO_LSB_PER_DPS
+
+        with self.lock:
+            last_t = self.t
+            q = list(self.quaternion)
+        if last_t is None:
+            # start on the accelerometer
+            last_t = t[0]
+            q = quaternion_from_up(acc_unit[0])[0].tolist()
+        dt = np.diff(t, prepend=last_t)
+
+        qs = np.empty((len(t), 4))
+        acc_unit = acc_unit.tolist()
+        gyro_rad = gyro_rad.tolist()
+        for i in range(len(t)):
+            q = self.step(q, gyro_rad[i], acc_unit[i], dt[i])
+            qs[i] = q
+
+        up = up_from_quaternion(qs)
+        pitch, roll = accel_angles(up)
+        yaw_rate = self._yaw_rate(up, gyro)
+        self._store(t, pitch, roll, yaw_rate, qs)
+        return pitch, roll, yaw_rate, qs
+
+
+FILTERS = {
+    'complementary': ComplementaryFilter,
+    'madgwick': MadgwickFilter,
+}
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+'''
+Hardware backends
+
+Pidog gets all its hardware (servos, i2c, spi, gpio and audio devices) from a
+backend object, so the same control code can run on the robot or, with
+pidog.sim_backend.SimBackend, on any Linux machine.
+
+Hardware libraries (robot_hat, smbus, spidev, gpiozero) are imported lazily
+by RobotHatBackend, importing this module does not need them.
+'''
+from time import sleep, monotonic
+
+
+class Backend():
+    """
+    Backend interface, one factory method per device used by Pidog
+    """
+
+    def time(self):
+        """
+        Current time of the backend clock, seconds
+        """
+        return monotonic()
+
+    def sleep(self, seconds):
+        sleep(seconds)
+
+    def reset_mcu(self):
+        raise NotImplementedError
+
+    def servos(self, pin_list, name, init_angles, init_order=None, db=None):
+        """
+        Create a servo group
+
+        :param pin_list: pwm channels of the servos
+        :type pin_list: list
+        :param name: group name, 'legs', 'head' or 'tail'
+        :type name: str
+        :param init_angles: initial angles
+        :type init_angles: list
+        :param init_order: servo initialization order
+        :type init_order: list
+        :param db: config file of the servo offsets
+        :type db: str
+        :return: robot_hat.Robot like object
+        """
+        raise NotImplementedError
+
+    def servo_frame_writer(self):
+        """
+        Batched write of all the servos of one ServoScheduler tick
+
+        :return: ServoFrameWriter, or None to write each servo group on its own
+        """
+        return None
+
+    def imu(self, db=None):
+        """
+        :return: Sh3001 like object
+        """
+        raise NotImplementedError
+
+    def rgb_strip(self, addr=0x74, nums=11):
+        """
+        :return: RGBStrip object
+        """
+        raise NotImplementedError
+
+    def dual_touch(self, sw1='D2', sw2='D3'):
+        """
+        :return: DualTouch object
+        """
+        raise NotImplementedError
+
+    def sound_direction(self):
+        """
+        :return: SoundDirection object
+        """
+        raise NotImplementedError
+
+    def music(self):
+        """
+        :return: robot_hat.Music like object
+        """
+        raise NotImplementedError
+
+    def audio_mixer(self):
+        """
+        :return: pygame.mixer like module, for SoundEngine
+        """
+        raise NotImplementedError
+
+    def ultrasonic(self, trig='D1', echo='D0', timeout=0.017):
+        """
+        :return: robot_hat.Ultrasonic like object
+        """
+        raise NotImplementedError
+
+    def battery_voltage(self):
+        raise NotImplementedError
+
+    def run_command(self, cmd):
+        """
+        :return: status, output
+        :rtype: tuple
+        """
+        raise NotImplementedError
+
+
+class RobotHatBackend(Backend):
+    """
+    Real hardware on the Robot HAT
+    """
+
+    PWM_ADDRESSES = [0x14, 0x15, 0x16] # Robot HAT mcu, same as robot_hat.PWM
+
+    def __init__(self, pwm_auto_increment=False):
+        """
+        :param pwm_auto_increment: send consecutive pwm channels in one i2c block write,
+            only if the Robot HAT mcu firmware auto-increments the channel register
+        :type pwm_auto_increment: bool
+        """
+        self.pwm_auto_increment = pwm_auto_increment
+
+    def reset_mcu(self):
+        from robot_hat import utils
+        utils.reset_mcu()
+        sleep(0.2)
+
+    def servos(self, pin_list, name, init_angles, init_order=None, db=None):
+        from robot_hat import Robot
+        return Robot(pin_list=pin_list, name=name, init_angles=init_angles,
+                     init_order=init_order, db=db)
+
+    def servo_frame_writer(self):
+        from robot_hat import I2C
+        from .servo_frame import ServoFrameWriter
+        bus = I2C(self.PWM_ADDRESSES)
+        return ServoFrameWriter(lambda reg, data: bus.write([reg] + data),
+                                auto_increment=self.pwm_auto_increment)
+
+    def imu(self, db=None):
+        from .sh3001 import Sh3001
+        return Sh3001(db=db)
+
+    def rgb_strip(self, addr=0x74, nums=11):
+        from .rgb_strip import RGBStrip
+        return RGBStrip(addr=addr, nums=nums)
+
+    def dual_touch(self, sw1='D2', sw2='D3'):
+        from .dual_touch import DualTouch
+        return DualTouch(sw1, sw2, clock=self.time)
+
+    def sound_direction(self):
+        from .sound_direction import SoundDirection
+        return SoundDirection(clock=self.time)
+
+    def music(self):
+        from robot_hat import Music
+        return Music()
+
+    def audio_mixer(self):
+        import pygame
+        return pygame.mixer
+
+    def ultrasonic(self, trig='D1', echo='D0', timeout=0.017):
+        from robot_hat import Pin, Ultrasonic
+        return Ultrasonic(Pin(trig), Pin(echo), timeout=timeout)
+
+    def battery_voltage(self):
+        from robot_hat import utils
+        return utils.get_battery_voltage()
+
+    def run_command(self, cmd):
+        from robot_hat import utils
+        return utils.run_command(cmd)
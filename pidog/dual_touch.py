@@ -1,18 +1,55 @@
 #!/usr/bin/env python3
-from robot_hat import Pin
 import time
+import queue
+import threading
+from collections import deque
 
 
 class DualTouch():
+    """
+    Dual touch sensor, left and right pads
 
-    SLIDE_MAX_INTERVAL = 0.5  # second, Maximum effective interval for sliding detection
+    Polled with read() by default. After enable_events(), both pins trigger
+    interrupts on every edge: transitions are timestamped into history,
+    taps ('L', 'R') and slides ('LS', 'RS') are recognized on the edges and
+    sent at once to the subscriber queues and callbacks, and read() returns
+    the last gesture not read yet.
+    """
 
-    def __init__(self, sw1='D2', sw2='D3'):
+    SLIDE_MAX_INTERVAL = 0.5  # second, Maximum effective interval for sliding detection
+    BOUNCE_TIME = 10 # ms, irq debounce
+    HISTORY_SIZE = 64 # transitions kept in history
 
-        self.touch_L = Pin(sw1, mode=Pin.IN, pull=Pin.PULL_UP)
-        self.touch_R = Pin(sw2, mode=Pin.IN, pull=Pin.PULL_UP)
+    def __init__(self, sw1='D2', sw2='D3', clock=time.time):
+        """
+        :param sw1: left pin name, or an input pin object with value()
+        :param sw2: right pin name, or an input pin object with value()
+        :param clock: time function of the timestamps, seconds, eg. the backend clock
+        :type clock: function
+        """
+        self.clock = clock
+        self.touch_L = self._input_pin(sw1)
+        self.touch_R = self._input_pin(sw2)
         self.last_touch = 'N'
         self.last_touch_time = 0
+        self.on_read = None # called with each value read, eg. to publish it
+
+        # edge events
+        self.events_enabled = False
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=self.HISTORY_SIZE) # (time, 'L' or 'R', level)
+        self._level = {'L': 0, 'R': 0}
+        self._release_time = {'L': 0, 'R': 0}
+        self._latched = None
+        self._subscribers = []
+        self._callbacks = []
+
+    @staticmethod
+    def _input_pin(pin):
+        if isinstance(pin, str):
+            from robot_hat import Pin
+            return Pin(pin, mode=Pin.IN, pull=Pin.PULL_UP)
+        return pin
 
     # def read(self):
     #     if self.touch_L.value() == 1:
@@ -29,23 +66,130 @@ class DualTouch():
     #             return 'R'
     #     return 'N'
 
+    def enable_events(self, bouncetime=BOUNCE_TIME):
+        """
+        Switch to interrupt driven gesture recognition
+
+        :param bouncetime: debounce time, ms
+        :type bouncetime: int
+        """
+        pins = {'L': self.touch_L, 'R': self.touch_R}
+        for side, pin in pins.items():
+            if not hasattr(pin, 'irq'):
+                raise ValueError(f"touch pin {side} does not support irq")
+        with self.lock:
+            for side, pin in pins.items():
+                self._level[side] = pin.value()
+            self.events_enabled = True
+        for side, pin in pins.items():
+            pin.irq(handler=lambda *args, side=side: self._on_edge(side),
+                    trigger=pin.IRQ_RISING_FALLING, bouncetime=bouncetime)
+
+    def _on_edge(self, side):
+        t = self.clock()
+        pin = self.touch_L if side == 'L' else self.touch_R
+        level = pin.value()
+        with self.lock:
+            if level == self._level[side]:
+                # bounce, or an edge already seen
+                return
+            self._level[side] = level
+            self.history.append((t, side, level))
+            if level == 0:
+                self._release_time[side] = t
+                return
+            # same rules as the polled read
+            other = 'R' if side == 'L' else 'L'
+            if self.last_touch == other and\
+                (self._level[other] or t - self._release_time[other] <= self.SLIDE_MAX_INTERVAL):
+                gesture = 'RS' if side == 'L' else 'LS'
+            else:
+                gesture = side
+            self.last_touch = side
+            self.last_touch_time = t
+            self._latched = gesture
+            subscribers = list(self._subscribers)
+            callbacks = list(self._callbacks)
+        for q in subscribers:
+            try:
+                q.put_nowait((t, gesture))
+            except queue.Full:
+                pass
+        for callback in callbacks:
+            callback(t, gesture)
+
+    def subscribe(self, maxsize=0):
+        """
+        Get the gestures in a queue, as (time, gesture) tuples
+
+        :param maxsize: queue size, 0 for unlimited, gestures are dropped when full
+        :type maxsize: int
+        :return: queue
+        :rtype: queue.Queue
+        """
+        q = queue.Queue(maxsize)
+        with self.lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self._subscribers.remove(q)
+
+    def add_callback(self, callback):
+        """
+        Call callback(time, gesture) on each gesture, from the irq thread,
+        it should return quickly
+
+        :param callback: function
+        :type callback: function
+        """
+        with self.lock:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        with self.lock:
+            self._callbacks.remove(callback)
+
     def read(self):
+        if self.events_enabled:
+            val = self._read_latched()
+        else:
+            val = self._read()
+        if self.on_read is not None:
+            self.on_read(val)
+        return val
+
+    def _read_latched(self):
+        # the last gesture not read yet, else what is touched now
+        with self.lock:
+            val, self._latched = self._latched, None
+            if val is None:
+                if self._level['L']:
+                    val = 'L'
+                elif self._level['R']:
+                    val = 'R'
+                else:
+                    val = 'N'
+        return val
+
+    def _read(self):
         if self.touch_L.value() == 1:
             if self.last_touch == 'R' and\
-                time.time() - self.last_touch_time <= self.SLIDE_MAX_INTERVAL:
+                self.clock() - self.last_touch_time <= self.SLIDE_MAX_INTERVAL:
                 val = 'RS'
             else:
                 val = 'L'
-            self.last_touch_time = time.time()
+            self.last_touch_time = self.clock()
             self.last_touch = 'L'
             return val
         elif self.touch_R.value() == 1:
             if self.last_touch == 'L' and\
-                time.time() - self.last_touch_time <= self.SLIDE_MAX_INTERVAL:
+                self.clock() - self.last_touch_time <= self.SLIDE_MAX_INTERVAL:
                 val = 'LS'
             else:
                 val = 'R'
-            self.last_touch_time = time.time()
+            self.last_touch_time = self.clock()
             self.last_touch = 'R'
             return val
         return 'N'
\ No newline at end of file
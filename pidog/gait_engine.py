@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+'''
+Continuous gait generator
+
+Same gaits as Walk and Trot, but driven by a continuous command instead of
+a fixed table per direction:
+
+    vx: forward speed, -1 (full stride backward) to 1 (full stride forward)
+    vyaw: turning rate, -1 (right) to 1 (left), shortens the strides of the
+        legs on the inner side like the LEFT / RIGHT tables do
+    step_height: height of the swinging foot, mm
+    cadence: steps speed, 1 for the frames of the tables, 2 for half as
+        many frames per section
+
+A gait cycle is made of sections, in each one some legs swing while the
+others push the body. Commands are applied at the next section boundary,
+the feet start from where they are, so the gait changes smoothly while
+walking. The frames are computed one at a time into preallocated buffers.
+
+    gait = GaitEngine('walk')
+    gait.command(vx=1, vyaw=0.5)
+    for _ in range(100):
+        coords = gait.next_section()
+        dog.legs_move(Pidog.legs_angle_calculation_batch(coords), immediately=False, speed=98)
+        dog.wait_legs_done()
+
+or streamed, a new command then reaches the servos within a few frames:
+
+    stream = dog.legs_stream((Pidog.legs_angle_calculation(coords) for coords in gait), speed=98)
+    gait.command(vyaw=-1)
+    ...
+    dog.legs_stop()
+'''
+import threading
+from math import cos, sin, pi
+import numpy as np
+
+
+class GaitEngine():
+    """
+    Phase based walk / trot generator
+    """
+
+    # legs: 0 left front, 1 right front, 2 left hind, 3 right hind
+    LEFT_LEGS = (0, 2)
+    RIGHT_LEGS = (1, 3)
+
+    # sections: legs swinging in each section of a forward cycle, reversed for backward
+    # y_offsets: body y offset going (forward straight, forward turning), (backward straight, backward turning)
+    GAITS = {
+        'walk': { # Walk
+            'sections': [[0], [], [3], [], [1], [], [2], []],
+            'steps': 6,
+            'stride': 80,
+            'step_height': 20,
+            'turning_rate': 0.3,
+            'center_of_gravity': -15,
+            'leg_offsets': [-10, -10, 20, 20],
+            'y_offsets': ((0, 0), (0, 0)),
+        },
+        'trot': { # Trot
+            'sections': [[0, 3], [1, 2]],
+            'steps': 3,
+            'stride': 100,
+            'step_height': 20,
+            'turning_rate': 0.5,
+            'center_of_gravity': -17,
+            'leg_offsets': [-5, -5, 5, 5],
+            'y_offsets': ((0, -2), (8, 1)),
+        },
+    }
+
+    Z_ORIGIN = 80
+    MIN_CADENCE = 0.5
+    MAX_CADENCE = 3
+
+    def __init__(self, gait='walk', z_origin=Z_ORIGIN):
+        """
+        :param gait: 'walk' or 'trot'
+        :type gait: str
+        :param z_origin: height of the feet on the ground, mm
+        :type z_origin: float or int
+        """
+        if gait not in self.GAITS:
+            raise ValueError(f"gait must be one of {list(self.GAITS)}")
+        self.gait = gait
+        params = self.GAITS[gait]
+        self.sections = params['sections']
+        self.steps = params['steps']
+        self.stride = params['stride']
+        self.turning_rate = params['turning_rate']
+        self.center_of_gravity = params['center_of_gravity']
+        self.leg_offsets = params['leg_offsets']
+        self.y_offsets = params['y_offsets']
+        self.z_origin = z_origin
+
+        self.lock = threading.Lock()
+        self._command = {'vx': 0.0, 'vyaw': 0.0, 'step_height': params['step_height'], 'cadence': 1.0}
+        # command of the current section
+        self.vx = 0.0
+        self.vyaw = 0.0
+        self.step_height = params['step_height']
+        self.cadence = 1.0
+
+        # state
+        self.section = 0
+        self.step = 0
+        self.steps_per_section = self.steps
+        self.backward = False
+        self.y = [0.0] * 4
+        self.width = [0.0] * 4 # signed stride of each leg
+        self.center = [0.0] * 4
+        self.stance_step = [0.0] * 4
+        self.swing_start = [0.0] * 4
+        self.swing_end = [0.0] * 4
+        self.swinging = [False] * 4
+
+        # buffers
+        max_steps = self._steps_per_section(self.MIN_CADENCE)
+        self.coords = np.zeros((4, 2)) # [y, z] of each leg, the last frame
+        self._frames = np.zeros((max_steps, 4, 2))
+
+        self.reset()
+
+    def command(self, vx=None, vyaw=None, step_height=None, cadence=None):
+        """
+        Set the command, applied at the next section boundary, None keeps the current value
+
+        :param vx: forward speed, -1 to 1
+        :type vx: float
+        :param vyaw: turning rate, -1 (right) to 1 (left)
+        :type vyaw: float
+        :param step_height: height of the swinging foot, mm
+        :type step_height: float or int
+        :param cadence: steps speed, 0.5 to 3
+        :type cadence: float
+        """
+        with self.lock:
+            if vx is not None:
+                self._command['vx'] = max(-1.0, min(1.0, float(vx)))
+            if vyaw is not None:
+                self._command['vyaw'] = max(-1.0, min(1.0, float(vyaw)))
+            if step_height is not None:
+                self._command['step_height'] = max(0.0, float(step_height))
+            if cadence is not None:
+                self._command['cadence'] = max(self.MIN_CADENCE, min(self.MAX_CADENCE, float(cadence)))
+
+    def _steps_per_section(self, cadence):
+        return max(2, int(round(self.steps / cadence)))
+
+    def _apply_command(self):
+        with self.lock:
+            self.vx = self._command['vx']
+            self.vyaw = self._command['vyaw']
+            self.step_height = self._command['step_height']
+            self.cadence = self._command['cadence']
+        self.steps_per_section = self._steps_per_section(self.cadence)
+        self._update_legs()
+
+    def _update_legs(self):
+        # strides and centers of the legs for the current command and direction
+        straight, turning = self.y_offsets[1 if self.backward else 0]
+        turn = abs(self.vyaw)
+        y_offset = self.center_of_gravity + straight + (turning - straight) * turn
+        stance_steps = (len(self.sections) - 1) * self.steps_per_section
+        for i in range(4):
+            # the legs on the inner side of the turn make shorter strides
+            inner = self.vyaw if i in self.LEFT_LEGS else -self.vyaw
+            scale = 1 - (1 - self.turning_rate) * max(0.0, inner)
+            self.width[i] = self.stride * self.vx * scale
+            self.center[i] = y_offset + self.leg_offsets[i] * scale
+            self.stance_step[i] = self.width[i] / stance_steps
+
+    def _section_legs(self, section):
+        if self.backward:
+            return self.sections[len(self.sections) - section - 1]
+        return self.sections[section]
+
+    def reset(self):
+        """
+        Put the feet where the current command expects them at the start of a cycle
+        """
+        self.section = 0
+        self.step = 0
+        self._apply_command()
+        self.backward = self.vx < 0
+        self._update_legs()
+        count = len(self.sections)
+        for i in range(4):
+            # sections of stance left before the leg swings
+            before = next(s for s in range(count) if i in self._section_legs(s))
+            self.y[i] = self.center[i] + self.width[i] / 2 - self.width[i] * before / (count - 1)
+            self.coords[i, 0] = self.y[i]
+            self.coords[i, 1] = self.z_origin
+
+    def _start_section(self):
+        if self.section == 0:
+            # direction changes at cycle boundaries only, so no leg swings twice
+            self.backward = self._command['vx'] < 0
+        self._apply_command()
+        legs = self._section_legs(self.section)
+        for i in range(4):
+            self.swinging[i] = i in legs
+            if self.swinging[i]:
+                self.swing_start[i] = self.y[i]
+                self.swing_end[i] = self.center[i] - self.width[i] / 2
+
+    def next_frame(self):
+        """
+        Compute the next frame
+
+        :return: [y, z] of the 4 feet, the same buffer is reused by the next call
+        :rtype: numpy.ndarray, shape (4, 2)
+        """
+        if self.step == 0:
+            self._start_section()
+        self.step += 1
+        theta = pi * self.step / self.steps_per_section
+        lift = (1 - cos(theta)) / 2
+        coords = self.coords
+        for i in range(4):
+            if self.swinging[i]:
+                self.y[i] = self.swing_start[i] + (self.swing_end[i] - self.swing_start[i]) * lift
+                coords[i, 1] = self.z_origin - self.step_height * sin(theta)
+            else:
+                self.y[i] += self.stance_step[i]
+                coords[i, 1] = self.z_origin
+            coords[i, 0] = self.y[i]
+        if self.step == self.steps_per_section:
+            self.step = 0
+            self.section = (self.section + 1) % len(self.sections)
+        return coords
+
+    def __iter__(self):
+        """
+        Endless frames, each one a reused buffer like next_frame, eg. for Pidog.legs_stream
+        """
+        while True:
+            yield self.next_frame()
+
+    def next_section(self):
+        """
+        Compute the frames up to the end of the current section
+
+        :return: frames, [y, z] of the 4 feet each, a view of a buffer
+            reused by the next call
+        :rtype: numpy.ndarray, shape (n, 4, 2)
+        """
+        count = 0
+        while True:
+            self._frames[count] = self.next_frame()
+            count += 1
+            if self.step == 0:
+                return self._frames[:count]
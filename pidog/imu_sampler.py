@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import threading
+from time import sleep, monotonic
+import numpy as np
+
+
+class ImuRingBuffer():
+    """
+    Fixed size ring buffer of timestamped imu samples
+
+    One writer (the sampler thread), any number of readers. The writer fills
+    a slot and then bumps count, readers copy out what they need and drop the
+    samples that got overwritten meanwhile, so nobody takes a lock.
+    """
+
+    def __init__(self, size=2048):
+        """
+        :param size: number of samples kept
+        :type size: int
+        """
+        if size < 2:
+            # the slot being written is never readable
+            raise ValueError('size must be at least 2')
+        self.size = size
+        self.t = np.zeros(size)
+        self.acc = np.zeros((size, 3))
+        self.gyro = np.zeros((size, 3))
+        self.count = 0 # total number of samples written
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def push(self, t, acc, gyro):
+        i = self.count % self.size
+        self.t[i] = t
+        self.acc[i] = acc
+        self.gyro[i] = gyro
+        self.count += 1
+
+    def latest(self):
+        """
+        :return: the last sample (t, acc, gyro), None if empty
+        :rtype: tuple
+        """
+        count = self.count
+        if count == 0:
+            return None
+        i = (count - 1) % self.size
+        t, acc, gyro = self.t[i], self.acc[i].tolist(), self.gyro[i].tolist()
+        # the writer fills the slot before bumping count, so the slot is
+        # being overwritten from count - 1 + size on
+        if self.count - count >= self.size - 1:
+            # overwritten while copying, take the newer one
+            return self.latest()
+        return t, acc, gyro
+
+    def read(self, since=0, max_samples=None):
+        """
+        Copy out the samples written after the count since
+
+        :param since: count returned by the previous read, 0 for all kept samples
+        :type since: int
+        :param max_samples: only the last max_samples samples
+        :type max_samples: int
+        :return: t (n), acc (n*3), gyro (n*3) arrays and the count to pass as since next time
+        :rtype: tuple
+        """
+        count = self.count
+        start = max(since, count - self.size)
+        if max_samples is not None:
+            start = max(start, count - max_samples)
+        index = np.arange(start, count) % self.size
+        t, acc, gyro = self.t[index], self.acc[index], self.gyro[index]
+        # drop the oldest samples if the writer caught up with them, the
+        # slot of sample self.count - size may be half written
+        overwritten = self.count - self.size - start + 1
+        if overwritten > 0:
+            t, acc, gyro = t[overwritten:], acc[overwritten:], gyro[overwritten:]
+        return t, acc, gyro, count
+
+
+class ImuSampler():
+    """
+    High rate imu acquisition
+
+    Reads the SH3001 data registers (one 12 bytes block read per sample)
+    in a tight loop paced at the chip output data rate, stamps each sample
+    with the backend clock, and pushes it, offset corrected, into an
+    ImuRingBuffer.
+    """
+
+    DEFAULT_HZ = 500 # SH3001 odr set by sh3001_init
+    MAX_ERRORS = 10 # consecutive read errors before the sampler gives up
+
+    def __init__(self, imu, hz=DEFAULT_HZ, size=2048, clock=monotonic, sleep=sleep):
+        """
+        :param imu: Sh3001 like object
+        :param hz: sampling rate, should not exceed the imu odr
+        :type hz: int or float
+        :param size: ring buffer size, samples
+        :type size: int
+        :param clock: clock function, seconds
+        :type clock: function
+        :param sleep: sleep function, seconds
+        :type sleep: function
+        """
+        self.imu = imu
+        self.hz = hz
+        self.period = 1.0 / hz
+        self.clock = clock
+        self.sleep = sleep
+        self.ring = ImuRingBuffer(size)
+        self.acc_offset = [0, 0, 0]
+        self.gyro_offset = [0, 0, 0]
+
+        self._thread = None
+        self.running = False
+        self.failed = False
+
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0
+        self._start_time = None
+
+    def set_offsets(self, acc_offset, gyro_offset):
+        self.acc_offset = list(acc_offset)
+        self.gyro_offset = list(gyro_offset)
+
+    def read_sample(self):
+        """
+        Read and store one sample
+
+        :return: True if read
+        :rtype: bool
+        """
+        data = self.imu._sh3001_getimudata()
+        if data == False:
+            return False
+        t = self.clock()
+        acc, gyro = data
+        self.ring.push(t,
+            [acc[i] + self.acc_offset[i] for i in range(3)],
+            [gyro[i] + self.gyro_offset[i] for i in range(3)])
+        self.samples += 1
+        return True
+
+    def _run(self):
+        fail_count = 0
+        next_sample = self.clock()
+        while self.running:
+            if self.read_sample():
+                fail_count = 0
+            else:
+                self.errors += 1
+                fail_count += 1
+                if fail_count > self.MAX_ERRORS:
+                    self.failed = True
+                    self.running = False
+                    break
+
+            next_sample += self.period
+            delay = next_sample - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            elif delay < -self.period:
+                # bus too slow for the rate, resync instead of bursting
+                self.overruns += 1
+                next_sample = self.clock()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.failed = False
+        self._start_time = self.clock()
+        self._thread = threading.Thread(name='imu_sampler_thread', target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """
+        :return: samples, achieved rate (Hz), read errors and overruns
+        :rtype: dict
+        """
+        rate = 0.0
+        if self._start_time is not None:
+            elapsed = self.clock() - self._start_time
+            if elapsed > 0:
+                rate = self.samples / elapsed
+        return {
+            'hz': self.hz,
+            'samples': self.samples,
+            'rate': rate,
+            'errors': self.errors,
+            'overruns': self.overruns,
+        }
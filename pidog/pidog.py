@@ -2,15 +2,22 @@
 import os
 import sys
 from time import sleep, time
-from multiprocessing import Process, Value, Lock
 import threading
+from itertools import chain
 import numpy as np
 from math import pi, sin, cos, sqrt, acos, atan2, atan
-from robot_hat import Robot, Pin, Ultrasonic, utils, Music, I2C
-from .sh3001 import Sh3001
-from .rgb_strip import RGBStrip
-from .sound_direction import SoundDirection
-from .dual_touch import DualTouch
+from .action_buffer import ActionBuffer, ActionStream
+from .backend import RobotHatBackend
+from .servo_scheduler import ServoScheduler
+from .imu_sampler import ImuSampler
+from .attitude import FILTERS as ATTITUDE_FILTERS
+from .sensor_bus import SensorBus
+from .sensory_worker import SensoryWorker
+from .sound_engine import SoundEngine
+from .pose_solver import PoseSolver
+from .pose_table import PoseCorrectionTable
+from .transitions import TransitionBlender
+from .action_library import ActionLibrary
 import warnings
 warnings.filterwarnings("ignore") # ignore warnings for pygame # not work
 
@@ -125,18 +132,61 @@ class Pidog():
 
     # init
     def __init__(self, leg_pins=DEFAULT_LEGS_PINS, head_pins=DEFAULT_HEAD_PINS, tail_pin=DEFAULT_TAIL_PIN,
-                 leg_init_angles=None, head_init_angles=None, tail_init_angle=None):
-
-
-        utils.reset_mcu()
-        sleep(0.2)
+                 leg_init_angles=None, head_init_angles=None, tail_init_angle=None, backend=None,
+                 servo_scheduler_hz=None, imu_sampler_hz=None, attitude_filter=None,
+                 touch_events=False, sound_events=False, pose_table=False, action_library=None):
+        '''
+        backend: hardware backend, default RobotHatBackend(),
+            use pidog.sim_backend.SimBackend() to run without the robot
+        servo_scheduler_hz: if set, drive legs, head and tail with one fixed-rate
+            ServoScheduler at this tick rate (eg. 100-200) instead of one thread each
+        imu_sampler_hz: if set, sample the imu at this rate (up to 500) into
+            the ring buffer self.imu_sampler.ring, instead of one sample every 50 ms
+        attitude_filter: if set, pitch and roll are estimated from the accelerometer
+            and the gyroscope, 'complementary', 'madgwick' or a
+            pidog.attitude.AttitudeEstimator object, see attitude()
+        touch_events: recognize touch gestures on pin interrupts instead of
+            polling, see DualTouch.enable_events and DualTouch.subscribe
+        sound_events: read the sound direction on the busy line edge instead of
+            polling, see SoundDirection.enable_events, SoundDirection.wait
+        pose_table: interpolate the body rotation of pose2legs_angle from a
+            precomputed roll / pitch grid, True or a
+            pidog.pose_table.PoseCorrectionTable object
+        action_library: read the actions tables from a precompiled file,
+            compiled and written there when missing or stale, True for
+            actions.bin next to pidog.conf, a path or a
+            pidog.action_library.ActionLibrary object
+        '''
+
+        if backend is None:
+            backend = RobotHatBackend()
+        self.backend = backend
+        # latest sensor values, readable from other processes by self.sensor_bus.name
+        self.sensor_bus = SensorBus()
+
+        self.backend.reset_mcu()
 
         from .actions_dictionary import ActionDict
         self.actions_dict = ActionDict()
+        if action_library is True:
+            action_library = ActionLibrary()
+        elif isinstance(action_library, str):
+            action_library = ActionLibrary(action_library)
+        if action_library:
+            self.actions_dict.use_library(action_library.open(self.actions_dict))
 
         self.body_height = 80
         self.pose = numpy_mat([0.0,  0.0,  self.body_height]).T  # target position vector
         self.rpy = np.array([0.0,  0.0,  0.0]) * pi / 180  # Euler angle, converted to radian value
+        self.pose_solver = PoseSolver(self.LEG, self.FOOT, self.BODY_LENGTH, self.BODY_WIDTH)
+        # feet positions, a matrix view of the pose solver buffer filled by set_legs
+        self.legpoint_struc = numpy_mat(self.pose_solver.legs)
+        self.set_legs([[0, 0]] * 4)
+        if pose_table is True:
+            pose_table = PoseCorrectionTable(self.pose_solver)
+        self.pose_table = pose_table or None
+        # cached blends between legs poses, see transition()
+        self.transitions = TransitionBlender(self.LEG, self.FOOT, ik=self.legs_angle_calculation_batch)
         self.leg_point_struc = numpy_mat([
             [-self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2,  0],
             [self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2,  0],
@@ -167,11 +217,11 @@ class Pidog():
         try:
             debug(f"config_file: {config_file}")
             debug("robot_hat init ... ", end='', flush=True)
-            self.legs = Robot(pin_list=leg_pins, name='legs', init_angles=leg_init_angles, init_order=[
+            self.legs = self.backend.servos(pin_list=leg_pins, name='legs', init_angles=leg_init_angles, init_order=[
                             0, 2, 4, 6, 1, 3, 5, 7], db=config_file)
-            self.head = Robot(pin_list=head_pins, name='head',
+            self.head = self.backend.servos(pin_list=head_pins, name='head',
                             init_angles=head_init_angles, db=config_file)
-            self.tail = Robot(pin_list=tail_pin, name='tail',
+            self.tail = self.backend.servos(pin_list=tail_pin, name='tail',
                             init_angles=tail_init_angle, db=config_file)
             # add thread
             self.thread_list.extend(["legs", "head", "tail"])
@@ -180,13 +230,14 @@ class Pidog():
             self.head.max_dps = self.HEAD_DPS
             self.tail.max_dps = self.TAIL_DPS
 
-            self.legs_action_buffer = []
-            self.head_action_buffer = []
-            self.tail_action_buffer = []
+            self.legs_action_buffer = ActionBuffer()
+            self.action_streams = {} # part -> ActionStream feeding its buffer
+            self.head_action_buffer = ActionBuffer()
+            self.tail_action_buffer = ActionBuffer()
 
-            self.legs_thread_lock = threading.Lock()
-            self.head_thread_lock = threading.Lock()
-            self.tail_thread_lock = threading.Lock()
+            self.legs_thread_lock = self.legs_action_buffer.lock
+            self.head_thread_lock = self.head_action_buffer.lock
+            self.tail_thread_lock = self.tail_action_buffer.lock
 
             self.legs_actions_coords_buffer = []
 
@@ -198,6 +249,21 @@ class Pidog():
             self.head_speed = 90
             self.tail_speed = 90
 
+            self.servo_scheduler = None
+            self.servo_frame_writer = None
+            if servo_scheduler_hz is not None:
+                # commit all the servos of a tick in one batch
+                self.servo_frame_writer = self.backend.servo_frame_writer()
+                self.servo_scheduler = ServoScheduler(servo_scheduler_hz, write=self.servo_frame_writer,
+                    clock=self.backend.time, sleep=self.backend.sleep)
+                self.servo_scheduler.add_group('legs', self.legs, self.legs_action_buffer,
+                    speed=lambda: self.legs_speed, on_keyframe=self._set_leg_current_angles)
+                self.servo_scheduler.add_group('head', self.head, self.head_action_buffer,
+                    speed=lambda: self.head_speed, transform=self._head_servo_angles,
+                    on_keyframe=self._set_head_current_angles)
+                self.servo_scheduler.add_group('tail', self.tail, self.tail_action_buffer,
+                    speed=lambda: self.tail_speed, on_keyframe=self._set_tail_current_angles)
+
             # done
             debug("done")
         except OSError:
@@ -206,12 +272,19 @@ class Pidog():
 
         try:
             debug("imu_sh3001 init ... ", end='', flush=True)
-            self.imu = Sh3001(db=config_file)
+            self.imu = self.backend.imu(db=config_file)
             self.imu_acc_offset = [0, 0, 0]
             self.imu_gyro_offset = [0, 0, 0]
             self.accData = [0, 0, 0]  # ax,ay,az
             self.gyroData = [0, 0, 0]  # gx,gy,gz
             self.imu_fail_count = 0
+            if isinstance(attitude_filter, str):
+                attitude_filter = ATTITUDE_FILTERS[attitude_filter]()
+            self.attitude_filter = attitude_filter
+            self.imu_sampler = None
+            if imu_sampler_hz is not None:
+                self.imu_sampler = ImuSampler(self.imu, imu_sampler_hz,
+                    clock=self.backend.time, sleep=self.backend.sleep)
             # add imu thread
             self.thread_list.append("imu")
             debug("done")
@@ -221,7 +294,7 @@ class Pidog():
         try:
             debug("rgb_strip init ... ", end='', flush=True)
             self.rgb_thread_run = True
-            self.rgb_strip = RGBStrip(addr=0X74, nums=11)
+            self.rgb_strip = self.backend.rgb_strip(addr=0X74, nums=11)
             self.rgb_strip.set_mode('breath', 'black')
             self.rgb_fail_count = 0
             # add rgb thread
@@ -232,7 +305,12 @@ class Pidog():
 
         try:
             debug("dual_touch init ... ", end='', flush=True)
-            self.dual_touch = DualTouch('D2', 'D3')
+            self.dual_touch = self.backend.dual_touch('D2', 'D3')
+            self.dual_touch.on_read = lambda value: self.sensor_bus.write('touch', value, t=self.backend.time())
+            if touch_events:
+                self.dual_touch.enable_events()
+                self.dual_touch.add_callback(
+                    lambda t, gesture: self.sensor_bus.write('touch', gesture, t=t))
             self.touch = 'N'
             debug("done")
         except:
@@ -240,7 +318,10 @@ class Pidog():
 
         try:
             debug("sound_direction init ... ", end='', flush=True)
-            self.ears = SoundDirection()
+            self.ears = self.backend.sound_direction()
+            self.ears.on_read = lambda value: self.sensor_bus.write('sound_direction', value, t=self.backend.time())
+            if sound_events:
+                self.ears.enable_events()
             # self.sound_direction = -1
             debug("done")
         except:
@@ -248,26 +329,64 @@ class Pidog():
 
         try:
             debug("sound_effect init ... ", end='', flush=True)
-            self.music = Music()
+            self.music = self.backend.music()
             debug("done")
         except:
             error("fail")
 
-        self.distance = Value('f', -1.0)
+        self.sound_engine = None
+        try:
+            debug("sound_engine init ... ", end='', flush=True)
+            self.sound_engine = SoundEngine(self.backend.audio_mixer(), self.SOUND_DIR,
+                                            run_command=self.backend.run_command,
+                                            sleep=self.backend.sleep)
+            self.sound_engine.open()
+            debug("done")
+        except Exception as e:
+            self.sound_engine = None
+            error(f"fail: {e}")
 
-        self.sensory_process = None
-        self.sensory_lock = Lock()
+        self.sensory_worker = None
 
         self.exit_flag = False
         self.action_threads_start()
         self.sensory_process_start()
 
     def read_distance(self):
-        return round(self.distance.value, 2)
+        return round(self.sensor_bus.read('distance')[0][0], 2)
+
+    def read_distance_info(self):
+        '''
+        Filtered distance with its confidence and age
+
+        :return: distance (cm, -1 for none), confidence (0-1), age (seconds, None if never read)
+        :rtype: tuple
+        '''
+        (distance, confidence), t = self.sensor_bus.read('distance')
+        age = None if t is None else self.backend.time() - t
+        return distance, confidence, age
+
+    def wait_distance(self, timeout=None):
+        '''
+        Wait for the next ultrasonic reading, instead of polling read_distance
+
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: distance (cm, -1 for none) and confidence (0-1), None on timeout
+        :rtype: tuple
+        '''
+        record = self.sensor_bus.wait_update('distance', timeout=timeout)
+        if record is None:
+            return None
+        return record[0]
 
     # action related: legs,head,tail,imu,rgb_strip
     def close_all_thread(self):
         self.exit_flag = True
+        # wake up the action threads blocked on empty buffers
+        self.legs_action_buffer.close()
+        self.head_action_buffer.close()
+        self.tail_action_buffer.close()
 
     def close(self):
         import signal
@@ -295,9 +414,12 @@ class Pidog():
             self.stop_and_lie()
             self.close_all_thread()
 
-            self.legs_thread.join()
-            self.head_thread.join()
-            self.tail_thread.join()
+            if self.servo_scheduler is not None:
+                self.servo_scheduler.stop()
+            else:
+                self.legs_thread.join()
+                self.head_thread.join()
+                self.tail_thread.join()
 
             if 'rgb' in self.thread_list:
                 self.rgb_thread_run = False
@@ -305,8 +427,11 @@ class Pidog():
                 self.rgb_strip.close()
             if 'imu' in self.thread_list:
                 self.imu_thread.join()
-            if self.sensory_process != None:
-                self.sensory_process.terminate()
+                if self.imu_sampler is not None:
+                    self.imu_sampler.stop()
+            if self.sensory_worker != None:
+                self.sensory_worker.stop()
+            self.sensor_bus.close()
 
             info('Quit')
         except Exception as e:
@@ -348,15 +473,24 @@ class Pidog():
     def action_threads_start(self):
         # Immutable objects int, float, string, tuple, etc., need to be declared with global
         # Variable object lists, dicts, instances of custom classes, etc., do not need to be declared with global
-        if 'legs' in self.thread_list:
+        if self.servo_scheduler is not None:
+            # one scheduler thread instead of the legs, head and tail threads
+            self.legs_action_buffer.open()
+            self.head_action_buffer.open()
+            self.tail_action_buffer.open()
+            self.servo_scheduler.start()
+        elif 'legs' in self.thread_list:
+            self.legs_action_buffer.open()
             self.legs_thread = threading.Thread(name='legs_thread', target=self._legs_action_thread)
             self.legs_thread.daemon = True
             self.legs_thread.start()
-        if 'head' in self.thread_list:
+        if 'head' in self.thread_list and self.servo_scheduler is None:
+            self.head_action_buffer.open()
             self.head_thread = threading.Thread(name='head_thread', target=self._head_action_thread)
             self.head_thread.daemon = True
             self.head_thread.start()
-        if 'tail' in self.thread_list:
+        if 'tail' in self.thread_list and self.servo_scheduler is None:
+            self.tail_action_buffer.open()
             self.tail_thread = threading.Thread(name='tail_thread', target=self._tail_action_thread)
             self.tail_thread.daemon = True
             self.tail_thread.start()
@@ -373,14 +507,17 @@ class Pidog():
     def _legs_action_thread(self):
         while not self.exit_flag:
             try:
-                with self.legs_thread_lock:
-                    self.leg_current_angles = list.copy(self.legs_action_buffer[0])
-                # Release lock after copying data before the next operations
-                self.legs.servo_move(self.leg_current_angles, self.legs_speed)
-                with self.legs_thread_lock:
-                    self.legs_action_buffer.pop(0)
-            except IndexError:
-                sleep(0.001)
+                # block until frames arrive, no polling
+                frame = self.legs_action_buffer.get()
+                if frame is None:
+                    break
+                self.leg_current_angles = list.copy(frame)
+                # blend keyframes carry their own speed
+                speed = getattr(frame, 'speed', self.legs_speed)
+                try:
+                    self.legs.servo_move(self.leg_current_angles, speed)
+                finally:
+                    self.legs_action_buffer.task_done()
             except Exception as e:
                 error(f'\r_legs_action_thread Exception:{e}')
                 break
@@ -389,18 +526,16 @@ class Pidog():
     def _head_action_thread(self):
         while not self.exit_flag:
             try:
-                with self.head_thread_lock:
-                    self.head_current_angles = list.copy(self.head_action_buffer[0])
-                    self.head_action_buffer.pop(0)
-                # Release lock after copying data before the next operations
-                _angles = list.copy(self.head_current_angles)
-                _angles[0] = self.limit(self.HEAD_YAW_MIN, self.HEAD_YAW_MAX, _angles[0])
-                _angles[1] = self.limit(self.HEAD_ROLL_MIN, self.HEAD_ROLL_MAX, _angles[1])
-                _angles[2] = self.limit(self.HEAD_PITCH_MIN, self.HEAD_PITCH_MAX, _angles[2])
-                _angles[2] += self.HEAD_PITCH_OFFSET
-                self.head.servo_move(_angles, self.head_speed)
-            except IndexError:
-                sleep(0.001)
+                frame = self.head_action_buffer.get()
+                if frame is None:
+                    break
+                self.head_current_angles = list.copy(frame)
+                _angles = self._head_servo_angles(self.head_current_angles)
+                speed = getattr(frame, 'speed', self.head_speed)
+                try:
+                    self.head.servo_move(_angles, speed)
+                finally:
+                    self.head_action_buffer.task_done()
             except Exception as e:
                 error(f'\r_head_action_thread Exception:{e}')
                 break
@@ -409,17 +544,38 @@ class Pidog():
     def _tail_action_thread(self):
         while not self.exit_flag:
             try:
-                with self.tail_thread_lock:
-                    self.tail_current_angles = list.copy(self.tail_action_buffer[0])
-                    self.tail_action_buffer.pop(0)
-                # Release lock after copying data before the next operations
-                self.tail.servo_move(self.tail_current_angles, self.tail_speed)
-            except IndexError:
-                sleep(0.001)
+                frame = self.tail_action_buffer.get()
+                if frame is None:
+                    break
+                self.tail_current_angles = list.copy(frame)
+                speed = getattr(frame, 'speed', self.tail_speed)
+                try:
+                    self.tail.servo_move(self.tail_current_angles, speed)
+                finally:
+                    self.tail_action_buffer.task_done()
             except Exception as e:
                 error(f'\r_tail_action_thread Exception:{e}')
                 break
 
+    def _head_servo_angles(self, angles):
+        # limit head angles, and add the pitch offset
+        _angles = list.copy(angles)
+        _angles[0] = self.limit(self.HEAD_YAW_MIN, self.HEAD_YAW_MAX, _angles[0])
+        _angles[1] = self.limit(self.HEAD_ROLL_MIN, self.HEAD_ROLL_MAX, _angles[1])
+        _angles[2] = self.limit(self.HEAD_PITCH_MIN, self.HEAD_PITCH_MAX, _angles[2])
+        _angles[2] += self.HEAD_PITCH_OFFSET
+        return _angles
+
+    # current angles, updated by servo scheduler when a keyframe starts
+    def _set_leg_current_angles(self, angles):
+        self.leg_current_angles = list.copy(angles)
+
+    def _set_head_current_angles(self, angles):
+        self.head_current_angles = list.copy(angles)
+
+    def _set_tail_current_angles(self, angles):
+        self.tail_current_angles = list.copy(angles)
+
     # rgb strip
     def _rgb_strip_thread(self):
         while self.rgb_thread_run:
@@ -456,7 +612,7 @@ class Pidog():
             _gx += self.gyroData[0]
             _gy += self.gyroData[1]
             _gz += self.gyroData[2]
-            sleep(0.1)
+            self.backend.sleep(0.1)
 
         self.imu_acc_offset[0] = round(-16384 - _ax/time, 0)
         self.imu_acc_offset[1] = round(0 - _ay/time, 0)
@@ -465,54 +621,87 @@ class Pidog():
         self.imu_gyro_offset[1] = round(0 - _gy/time, 0)
         self.imu_gyro_offset[2] = round(0 - _gz/time, 0)
 
+        if self.imu_sampler is not None:
+            self.imu_sampler.set_offsets(self.imu_acc_offset, self.imu_gyro_offset)
+            self.imu_sampler.start()
+        imu_since = 0 # ring buffer count of the samples given to the attitude filter
+
         while not self.exit_flag:
             try:
-                data = self.imu._sh3001_getimudata()
-                if data == False:
-                    self.imu_fail_count += 1
-                    if self.imu_fail_count > 10:
-                        error('\r_imu_thread imu data error')
-                        break
-                self.accData, self.gyroData = data
-                self.accData[0] += self.imu_acc_offset[0]
-                self.accData[1] += self.imu_acc_offset[1]
-                self.accData[2] += self.imu_acc_offset[2]
-                self.gyroData[0] += self.imu_gyro_offset[0]
-                self.gyroData[1] += self.imu_gyro_offset[1]
-                self.gyroData[2] += self.imu_gyro_offset[2]
-                ax = self.accData[0]
-                ay = self.accData[1]
-                az = self.accData[2]
-                ay = -ay
-                az = -az
-
-                self.pitch = atan(ay/sqrt(ax*ax+az*az))*57.2957795
-                self.roll = atan(az/sqrt(ax*ax+ay*ay))*57.2957795
+                if self.imu_sampler is not None:
+                    # the sampler owns the imu, take its latest sample
+                    if self.imu_sampler.failed:
+                        raise IOError('imu sampler stopped')
+                    sample = self.imu_sampler.ring.latest()
+                    if sample is None:
+                        self.backend.sleep(0.05)
+                        continue
+                    _, self.accData, self.gyroData = sample
+                    if self.attitude_filter is not None:
+                        # fuse all the samples since the last loop
+                        t, acc, gyro, imu_since = self.imu_sampler.ring.read(imu_since)
+                        if len(t) > 0:
+                            self.attitude_filter.update_batch(t, acc, gyro)
+                else:
+                    data = self.imu._sh3001_getimudata()
+                    if data == False:
+                        self.imu_fail_count += 1
+                        if self.imu_fail_count > 10:
+                            error('\r_imu_thread imu data error')
+                            break
+                    self.accData, self.gyroData = data
+                    self.accData[0] += self.imu_acc_offset[0]
+                    self.accData[1] += self.imu_acc_offset[1]
+                    self.accData[2] += self.imu_acc_offset[2]
+                    self.gyroData[0] += self.imu_gyro_offset[0]
+                    self.gyroData[1] += self.imu_gyro_offset[1]
+                    self.gyroData[2] += self.imu_gyro_offset[2]
+                    if self.attitude_filter is not None:
+                        self.attitude_filter.update(self.backend.time(), self.accData, self.gyroData)
+
+                if self.attitude_filter is not None:
+                    attitude = self.attitude_filter.snapshot()
+                    self.pitch = attitude['pitch']
+                    self.roll = attitude['roll']
+                else:
+                    ax = self.accData[0]
+                    ay = self.accData[1]
+                    az = self.accData[2]
+                    ay = -ay
+                    az = -az
+
+                    self.pitch = atan(ay/sqrt(ax*ax+az*az))*57.2957795
+                    self.roll = atan(az/sqrt(ax*ax+ay*ay))*57.2957795
+
+                t = self.backend.time()
+                self.sensor_bus.write('imu', *self.accData, *self.gyroData, t=t)
+                self.sensor_bus.write('attitude', self.pitch, self.roll, t=t)
+                self.sensor_bus.write('motion', not self.legs_action_buffer.is_done(), t=t)
 
                 self.imu_fail_count = 0
-                sleep(0.05)
+                self.backend.sleep(0.05)
             except Exception as e:
                 self.imu_fail_count += 1
-                sleep(0.001)
+                self.backend.sleep(0.001)
                 if self.imu_fail_count > 10:
                     error(f'\r_imu_thread Exception:{e}')
-                    self.exit_flag = True
+                    self.close_all_thread()
                     break
 
     # clear actions buff
     def legs_stop(self):
-        with self.legs_thread_lock:
-            self.legs_action_buffer.clear()
+        self.stop_stream('legs')
+        self.legs_action_buffer.clear()
         self.wait_legs_done()
 
     def head_stop(self):
-        with self.head_thread_lock:
-            self.head_action_buffer.clear()
+        self.stop_stream('head')
+        self.head_action_buffer.clear()
         self.wait_head_done()
 
     def tail_stop(self):
-        with self.tail_thread_lock:
-            self.tail_action_buffer.clear()
+        self.stop_stream('tail')
+        self.tail_action_buffer.clear()
         self.wait_tail_done()
 
     def body_stop(self):
@@ -521,12 +710,25 @@ class Pidog():
         self.tail_stop()
 
     # move
+    # immediately=False stops the stream of the part, its queued frames are
+    # kept and the new ones follow, instead of interleaving with the stream
     def legs_move(self, target_angles, immediately=True, speed=50):
         if immediately == True:
             self.legs_stop()
+        else:
+            self.stop_stream('legs')
+        self._legs_push(target_angles, speed)
+
+    def _legs_push(self, target_angles, speed):
         self.legs_speed = speed
-        with self.legs_thread_lock:
-            self.legs_action_buffer += target_angles
+        # range faster while moving, back to the slow rate when the legs are idle
+        self.sensor_bus.write('motion', True, t=self.backend.time())
+        self.legs_action_buffer.extend(target_angles)
+        self.legs_action_buffer.remove_done_callback(self._legs_idle)
+        self.legs_action_buffer.add_done_callback(self._legs_idle)
+
+    def _legs_idle(self):
+        self.sensor_bus.write('motion', False, t=self.backend.time())
         
     def head_rpy_to_angle(self, target_yrp, roll_comp=0, pitch_comp=0):
         yaw, roll, pitch = target_yrp
@@ -540,69 +742,94 @@ class Pidog():
     def head_move(self, target_yrps, roll_comp=0, pitch_comp=0, immediately=True, speed=50):
         if immediately == True:
             self.head_stop()
+        else:
+            self.stop_stream('head')
+        self._head_push(target_yrps, roll_comp, pitch_comp, speed)
+
+    def _head_push(self, target_yrps, roll_comp, pitch_comp, speed):
         self.head_speed = speed
         
         angles = [self.head_rpy_to_angle(
             target_yrp, roll_comp, pitch_comp) for target_yrp in target_yrps]
 
-        with self.head_thread_lock:
-            self.head_action_buffer += angles
+        self.head_action_buffer.extend(angles)
 
     def head_move_raw(self, target_angles, immediately=True, speed=50):
         if immediately == True:
             self.head_stop()
+        else:
+            self.stop_stream('head')
         self.head_speed = speed
-        with self.head_thread_lock:
-            self.head_action_buffer += target_angles
+        self.head_action_buffer.extend(target_angles)
 
     def tail_move(self, target_angles, immediately=True, speed=50):
         if immediately == True:
             self.tail_stop()
+        else:
+            self.stop_stream('tail')
+        self._tail_push(target_angles, speed)
+
+    def _tail_push(self, target_angles, speed):
         self.tail_speed = speed
-        with self.tail_thread_lock:
-            self.tail_action_buffer += target_angles
+        self.tail_action_buffer.extend(target_angles)
         
-    # ultrasonic
-    def _ultrasonic_thread(self, distance_addr, lock):
-        while True:
-            try:
-                with lock:
-                    val = round(float(self.ultrasonic.read()), 2)
-                    distance_addr.value = val
-                sleep(0.01)
-            except Exception as e:
-                sleep(0.1)
-                error(f'\rultrasonic_thread  except: {e}')
-                break
+    # streams: frames pulled from an iterator with a bounded lookahead
+    def _start_stream(self, part, buffer, frames, push, lookahead):
+        self.stop_stream(part)
+        stream = ActionStream(buffer, frames, push, lookahead)
+        self.action_streams[part] = stream
+        return stream.start()
+
+    def stop_stream(self, part):
+        '''
+        Stop the stream feeding a part, the frames already queued are kept
+
+        :param part: 'legs', 'head' or 'tail'
+        :type part: str
+        '''
+        stream = self.action_streams.pop(part, None)
+        if stream is not None:
+            stream.stop(clear=False)
+
+    def legs_stream(self, frames, lookahead=ActionStream.LOOKAHEAD, speed=50):
+        '''
+        Feed the legs from an iterator of frames (8 angles each), keeping at
+        most lookahead frames queued, replaces the previous legs stream,
+        legs_stop() stops it, so does queuing frames with legs_move or
+        do_action
+
+        :param frames: iterable of frames, may be endless, eg. a GaitEngine
+            mapped through legs_angle_calculation
+        :param lookahead: max number of queued frames
+        :type lookahead: int
+        :param speed: speed, 0-100
+        :type speed: int
+        :return: the stream
+        :rtype: ActionStream
+        '''
+        return self._start_stream('legs', self.legs_action_buffer, frames,
+            lambda frame: self._legs_push([frame], speed), lookahead)
+
+    def head_stream(self, frames, lookahead=ActionStream.LOOKAHEAD, speed=50, pitch_comp=0):
+        '''
+        Same as legs_stream, frames are [yaw, roll, pitch] like head_move
+        '''
+        return self._start_stream('head', self.head_action_buffer, frames,
+            lambda frame: self._head_push([frame], 0, pitch_comp, speed), lookahead)
+
+    def tail_stream(self, frames, lookahead=ActionStream.LOOKAHEAD, speed=50):
+        '''
+        Same as legs_stream, for the tail
+        '''
+        return self._start_stream('tail', self.tail_action_buffer, frames,
+            lambda frame: self._tail_push([frame], speed), lookahead)
 
     # sensory_process : ultrasonic
-    def sensory_process_work(self, distance_addr, lock):
-        try:
-            debug("ultrasonic init ... ", end='', flush=True)
-            echo = Pin('D0')
-            trig = Pin('D1')
-            self.ultrasonic = Ultrasonic(trig, echo, timeout=0.017)
-            # add ultrasonic thread
-            self.thread_list.append("ultrasonic")
-            debug("done")
-        except Exception as e:
-            error("fail")
-            raise ValueError(e)
-
-        if 'ultrasonic' in self.thread_list:
-            ultrasonic_thread = threading.Thread(name='ultrasonic_thread',
-                                             target=self._ultrasonic_thread,
-                                             args=(distance_addr, lock,))
-            # ultrasonic_thread.daemon = True
-            ultrasonic_thread.start()
-
     def sensory_process_start(self):
-        if self.sensory_process != None:
-            self.sensory_process.terminate()
-        self.sensory_process = Process(name='sensory_process',
-                                         target=self.sensory_process_work,
-                                         args=(self.distance, self.sensory_lock))
-        self.sensory_process.start()
+        if self.sensory_worker != None:
+            self.sensory_worker.stop()
+        self.sensory_worker = SensoryWorker(self.backend, self.sensor_bus)
+        self.sensory_worker.start()
 
     # reset: stop, stop_and_lie
     def stop_and_lie(self, speed=85):
@@ -616,7 +843,7 @@ class Pidog():
         except Exception as e:
             error(f'\rstop_and_lie error:{e}')
 
-    def speak(self, name, volume=100):
+    def speak(self, name, volume=100, interrupt=False):
         """
         speak, play audio
 
@@ -624,23 +851,12 @@ class Pidog():
         :type name: str
         :param volume: volume, 0-100
         :type volume: int
+        :param interrupt: cut the previous interrupting sound instead of mixing with it
+        :type interrupt: bool
         """
-        if not is_run_with_root and not hasattr(self, "speak_first"):
-            self.speak_first = True
-            warn("Play sound needs to be run with sudo.")
-        status, _ = utils.run_command('sudo killall pulseaudio') # Solve the problem that there is no sound when running in the vnc environment
-
-        if os.path.isfile(name):
-            self.music.sound_play_threading(name, volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.mp3'):
-            self.music.sound_play_threading(self.SOUND_DIR+name+'.mp3', volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.wav'):
-            self.music.sound_play_threading(self.SOUND_DIR+name+'.wav', volume)
-        else:
-            warn(f'No sound found for {name}')
-            return False
+        return self._speak(name, volume, interrupt, False)
 
-    def speak_block(self, name, volume=100):
+    def speak_block(self, name, volume=100, interrupt=False):
         """
         speak, play audio with block
 
@@ -648,19 +864,19 @@ class Pidog():
         :type name: str
         :param volume: volume, 0-100
         :type volume: int
+        :param interrupt: cut the previous interrupting sound instead of mixing with it
+        :type interrupt: bool
         """
+        return self._speak(name, volume, interrupt, True)
+
+    def _speak(self, name, volume, interrupt, block):
         if not is_run_with_root and not hasattr(self, "speak_first"):
             self.speak_first = True
             warn("Play sound needs to be run with sudo.")
-        _status, _ = utils.run_command('sudo killall pulseaudio') # Solve the problem that there is no sound when running in the vnc environment
-        
-        if os.path.isfile(name):
-            self.music.sound_play(name, volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.mp3'):
-            self.music.sound_play(self.SOUND_DIR+name+'.mp3', volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.wav'):
-            self.music.sound_play(self.SOUND_DIR+name+'.wav', volume)
-        else:
+        if self.sound_engine is None:
+            warn('No sound engine')
+            return False
+        if self.sound_engine.play(name, volume, interrupt=interrupt, block=block) is None:
             warn(f'No sound found for {name}')
             return False
 
@@ -729,16 +945,8 @@ class Pidog():
             self.rpy[2] = yaw / 180. * pi
 
     def set_legs(self, legs_list):
-        self.legpoint_struc = numpy_mat([
-            [-self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2 +
-                legs_list[0][0], self.body_height - legs_list[0][1]],
-            [self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2 +
-                legs_list[1][0], self.body_height - legs_list[1][1]],
-            [-self.BODY_WIDTH / 2,  self.BODY_LENGTH / 2 +
-                legs_list[2][0], self.body_height - legs_list[2][1]],
-            [self.BODY_WIDTH / 2,  self.BODY_LENGTH / 2 +
-                legs_list[3][0], self.body_height - legs_list[3][1]]
-        ]).T
+        # in place, legpoint_struc sees the new values
+        self.pose_solver.set_legs(legs_list, self.body_height)
 
     # pose and Euler Angle algorithm
     def pose2coords(self):
@@ -777,6 +985,18 @@ class Pidog():
         return {"leg": leg_coor_list, "body": body_coor_list}
 
     def pose2legs_angle(self):
+        '''
+        Legs angles for the pose, rpy and legs set by set_pose, set_rpy and set_legs
+
+        :return: 8 angles, degrees
+        :rtype: list
+        '''
+        if self.pose_table is not None:
+            return self.pose_table.solve(self.pose, self.rpy).tolist()
+        return self.pose_solver.solve(self.pose, self.rpy).tolist()
+
+    def pose2legs_angle_slow(self):
+        # reference implementation of pose2legs_angle, on numpy matrices
         data = self.pose2coords()
         leg_coor_list = data["leg"]
         body_coor_list = data["body"]
@@ -872,6 +1092,42 @@ class Pidog():
 
         return translate_list
 
+    @classmethod
+    def legs_angle_calculation_batch(cls, coords):
+        """
+        Vectorized legs_angle_calculation, solve many frames in one call
+
+        :param coords: foot coordinates, N frames * 4 legs * [y, z]
+        :type coords: list or numpy.ndarray, shape (N, 4, 2)
+        :return: servo angles, N frames * 8 angles
+        :rtype: numpy.ndarray, shape (N, 8)
+        """
+        coords = np.asarray(coords, dtype=float)
+        if coords.ndim == 2:
+            coords = coords[np.newaxis]
+        y = coords[..., 0]
+        z = coords[..., 1]
+        u = np.hypot(y, z)
+        if not u.all():
+            # coord2polar divides by u
+            raise ZeroDivisionError('float division by zero')
+        # same as coord2polar, clamp cos values to [-1, 1] before acos
+        cos_angle1 = (cls.FOOT**2 + cls.LEG**2 - u**2) / (2 * cls.FOOT * cls.LEG)
+        beta = np.arccos(np.clip(cos_angle1, -1, 1))
+        angle1 = np.arctan2(y, z)
+        cos_angle2 = (cls.LEG**2 + u**2 - cls.FOOT**2) / (2 * cls.LEG * u)
+        angle2 = np.arccos(np.clip(cos_angle2, -1, 1))
+        leg_angles = (angle2 + angle1) / pi * 180
+        foot_angles = beta / pi * 180 - 90
+        # The left and right sides are opposite
+        leg_angles[:, 1::2] *= -1
+        foot_angles[:, 1::2] *= -1
+
+        angles = np.empty((coords.shape[0], 8))
+        angles[:, 0::2] = leg_angles
+        angles[:, 1::2] = foot_angles
+        return angles
+
     # limit
     def limit(self, min, max, x):
         if x > max:
@@ -907,51 +1163,174 @@ class Pidog():
         self.servo_move(translate_list, speed)
 
     # do action
-    def do_action(self, action_name, step_count=1, speed=50, pitch_comp=0):
+    def do_action(self, action_name, step_count=1, speed=50, pitch_comp=0, lookahead=None):
+        '''
+        Queue an action, without waiting for it, stops the stream of its
+        part (the frames queued by the stream are kept)
+
+        :param lookahead: if set, stream the frames with this lookahead instead
+            of queuing all the steps, step_count None then repeats forever
+        :type lookahead: int
+        :return: the part moved, 'legs', 'head' or 'tail', None on error
+        :rtype: str
+        '''
         try:
+            if lookahead is not None:
+                frames, part = self.actions_dict.iter_action(action_name, step_count)
+                if part == 'legs':
+                    self.legs_stream(frames, lookahead, speed)
+                elif part == 'head':
+                    self.head_stream(frames, lookahead, speed, pitch_comp)
+                elif part == 'tail':
+                    self.tail_stream(frames, lookahead, speed)
+                return part
             actions, part = self.actions_dict[action_name]
+            # enqueue all steps in one bulk append
             if part == 'legs':
-                for _ in range(step_count):
-                    self.legs_move(actions, immediately=False, speed=speed)
+                self.legs_move(actions * step_count, immediately=False, speed=speed)
             elif part == 'head':
-                for _ in range(step_count):
-                    self.head_move(actions, pitch_comp=pitch_comp, immediately=False, speed=speed)
+                self.head_move(actions * step_count, pitch_comp=pitch_comp, immediately=False, speed=speed)
             elif part == 'tail':
-                for _ in range(step_count):
-                    self.tail_move(actions, immediately=False, speed=speed)
+                self.tail_move(actions * step_count, immediately=False, speed=speed)
+            return part
         except KeyError:
             error("do_action: No such action")
         except Exception as e:
             error(f"do_action:{e}")
 
-    def wait_legs_done(self):
-        while not self.is_legs_done():
-            sleep(0.001)
+    def transition(self, action_name, step_count=1, speed=50, space='joint', frames=None, via=None, lookahead=None):
+        '''
+        Blend from the current legs pose into a legs action, without waiting:
+        the queued legs frames are dropped, the frame in progress finishes,
+        then a short blend leads to the first frame of the action, in the
+        time of one keyframe at speed
+
+        :param space: 'joint' or 'foot', see TransitionBlender.blend
+        :type space: str
+        :param frames: number of blend frames between two poses, default from the distance
+        :type frames: int
+        :param via: legs frames to pass through on the way
+        :type via: list
+        :param lookahead: if set, stream the frames like do_action
+        :type lookahead: int
+        :return: the part moved, None on error
+        :rtype: str
+        '''
+        try:
+            actions, part = self.actions_dict[action_name]
+            if part != 'legs':
+                return self.do_action(action_name, step_count, speed, lookahead=lookahead)
+            self.stop_stream('legs')
+            self.legs_action_buffer.clear()
+            # the frame in progress, or the last one done
+            waypoints = [self.leg_current_angles] + list(via or []) + [actions[0]]
+            blend = []
+            for start, end in zip(waypoints, waypoints[1:]):
+                # each leg of the way takes the time of one keyframe
+                blend.extend(self.transitions.keyframes(start, end, speed, space, frames))
+            # the blend ends on the first frame of the action
+            if lookahead is not None:
+                action_frames, _ = self.actions_dict.iter_action(action_name, step_count)
+                next(action_frames, None)
+                self.legs_stream(chain(blend, action_frames), lookahead, speed)
+            else:
+                self.legs_move(blend + (actions * step_count)[1:], immediately=False, speed=speed)
+            return part
+        except KeyError:
+            error("transition: No such action")
+        except Exception as e:
+            error(f"transition:{e}")
 
-    def wait_head_done(self):
-        while not self.is_head_done():
-            sleep(0.001)
+    def wait_legs_done(self, timeout=None):
+        """
+        Block until the legs buffer is empty and the last frame is finished
 
-    def wait_tail_done(self):
-        while not self.is_tail_done():
-            sleep(0.001)
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: True if done, False on timeout
+        :rtype: bool
+        """
+        return self.legs_action_buffer.wait_done(timeout)
 
-    def wait_all_done(self):
-        self.wait_legs_done()
-        self.wait_head_done()
-        self.wait_tail_done()
+    def wait_head_done(self, timeout=None):
+        return self.head_action_buffer.wait_done(timeout)
+
+    def wait_tail_done(self, timeout=None):
+        return self.tail_action_buffer.wait_done(timeout)
+
+    def wait_all_done(self, timeout=None):
+        if timeout is not None:
+            deadline = time() + timeout
+        for wait_done in (self.wait_legs_done, self.wait_head_done, self.wait_tail_done):
+            remaining = None if timeout is None else max(0, deadline - time())
+            if not wait_done(remaining):
+                return False
+        return True
 
     def is_legs_done(self):
-        return not bool(len(self.legs_action_buffer) > 0)
+        return self.legs_action_buffer.is_done()
 
     def is_head_done(self):
-        return not bool(len(self.head_action_buffer) > 0)
+        return self.head_action_buffer.is_done()
 
     def is_tail_done(self):
-        return not bool(len(self.tail_action_buffer) > 0)
+        return self.tail_action_buffer.is_done()
 
     def is_all_done(self):
         return self.is_legs_done() and self.is_head_done() and self.is_tail_done()
 
+    def servo_scheduler_stats(self):
+        """
+        Tick, overrun and jitter statistics of the servo scheduler,
+        and frame / i2c transaction counts of the frame writer
+
+        :return: statistics, None if the servo scheduler is not used
+        :rtype: dict
+        """
+        if self.servo_scheduler is None:
+            return None
+        stats = self.servo_scheduler.stats()
+        if self.servo_frame_writer is not None:
+            stats.update(self.servo_frame_writer.stats())
+        return stats
+
+    def attitude(self):
+        """
+        Latest estimate of the attitude filter
+
+        :return: t, roll, pitch, yaw_rate and quaternion, see
+            pidog.attitude.AttitudeEstimator.snapshot, None if no filter is used
+        :rtype: dict
+        """
+        if getattr(self, 'attitude_filter', None) is None:
+            return None
+        return self.attitude_filter.snapshot()
+
+    def imu_sampler_stats(self):
+        """
+        Sample count, achieved rate, read errors and overruns of the imu sampler
+
+        :return: statistics, None if the imu sampler is not used
+        :rtype: dict
+        """
+        if getattr(self, 'imu_sampler', None) is None:
+            return None
+        return self.imu_sampler.stats()
+
+    def action_buffers_stats(self):
+        """
+        Backlog of the action buffers
+
+        :return: depth, pushed, popped and dropped frame counts of legs, head and tail
+        :rtype: dict
+        """
+        return {
+            'legs': self.legs_action_buffer.stats(),
+            'head': self.head_action_buffer.stats(),
+            'tail': self.tail_action_buffer.stats(),
+        }
+
     def get_battery_voltage(self):
-        return round( utils.get_battery_voltage(), 2)
+        voltage = round(self.backend.battery_voltage(), 2)
+        self.sensor_bus.write('battery', voltage, t=self.backend.time())
+        return voltage
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+from math import pi, sin, cos
+import numpy as np
+
+
+class PoseSolver():
+    """
+    Body pose to legs angles, for closed loop balance
+
+    Same result as Pidog.pose2legs_angle, computed on preallocated buffers:
+    the rotation of the body (roll, pitch and yaw fused into one matrix) is
+    applied to the four shoulders in one matrix product, and the inverse
+    kinematics of the four legs is solved with numpy ufuncs writing into
+    their output buffers, so a solve does not allocate any array.
+
+    Only the y (forward) and z (up) rows of the rotation are used, the legs
+    move in the y-z plane.
+    """
+
+    LEG = 42
+    FOOT = 76
+    BODY_LENGTH = 117
+    BODY_WIDTH = 98
+
+    def __init__(self, leg=LEG, foot=FOOT, body_length=BODY_LENGTH, body_width=BODY_WIDTH):
+        """
+        :param leg: upper leg length, mm
+        :param foot: lower leg length, mm
+        :param body_length: distance between front and hind shoulders, mm
+        :param body_width: distance between left and right shoulders, mm
+        """
+        self.leg = leg
+        self.foot = foot
+        # shoulders in body frame, x, y, z rows, LF, RF, LH, RH columns
+        self.body_struct = np.array([
+            [-body_width / 2, body_width / 2, -body_width / 2, body_width / 2],
+            [-body_length / 2, -body_length / 2, body_length / 2, body_length / 2],
+            [0.0, 0.0, 0.0, 0.0]])
+        # feet in field frame, same layout, filled in place by set_legs
+        self.legs = self.body_struct.copy()
+
+        # buffers
+        self._rot = np.zeros((2, 3)) # y and z rows of the rotation
+        self.body = np.zeros((2, 4)) # rotated shoulders, y and z, input of solve_rotated
+        self._y = np.zeros(4)
+        self._z = np.zeros(4)
+        self._u2 = np.zeros(4)
+        self._u = np.zeros(4)
+        self._a = np.zeros(4)
+        self._b = np.zeros(4)
+        self.angles = np.zeros(8) # leg, foot, for LF, RF, LH, RH
+        self._leg_angles = self.angles[0::2]
+        self._foot_angles = self.angles[1::2]
+        self._right_angles = (self.angles[2:4], self.angles[6:8])
+        self._legs_y, self._legs_z = self.legs[1], self.legs[2]
+        self._body_y, self._body_z = self.body[0], self.body[1]
+
+    def set_legs(self, legs_list, body_height):
+        """
+        Set the feet positions, in place
+
+        :param legs_list: [y, z] of each foot relative to its shoulder, 4 legs
+        :type legs_list: list
+        :param body_height: body height, mm
+        :type body_height: float or int
+        """
+        legs = self.legs
+        for i in range(4):
+            legs[1, i] = self.body_struct[1, i] + legs_list[i][0]
+            legs[2, i] = body_height - legs_list[i][1]
+
+    def solve(self, pose, rpy):
+        """
+        Legs angles for a body pose
+
+        :param pose: body position x, y, z, mm, any array with 3 values
+        :param rpy: roll, pitch, yaw, radians
+        :return: servo angles of the legs, degrees, the same buffer is
+            reused by the next solve, copy it to keep it
+        :rtype: numpy.ndarray, shape (8,)
+        """
+        self.rotate(rpy[0], rpy[1], rpy[2], self.body)
+        return self.solve_rotated(pose, rpy[1])
+
+    @staticmethod
+    def rotation(roll, pitch, yaw, out):
+        """
+        Rows y and z of rotx(roll) * roty(-pitch) * rotz(yaw), the body rotation of Pidog.pose2coords
+
+        :param roll: radians
+        :param pitch: radians
+        :param yaw: radians
+        :param out: output, shape (2, 3)
+        :type out: numpy.ndarray
+        """
+        cr, sr = cos(roll), sin(roll)
+        cp, sp = cos(-pitch), sin(-pitch)
+        cy, sy = cos(yaw), sin(yaw)
+        out[0, 0] = cp * sy
+        out[0, 1] = cp * cy
+        out[0, 2] = -sp
+        out[1, 0] = sr * cy + cr * sp * sy
+        out[1, 1] = -sr * sy + cr * sp * cy
+        out[1, 2] = cr * cp
+
+    def rotate(self, roll, pitch, yaw, out):
+        """
+        y and z of the shoulders of the rotated body, before the body translation
+
+        :param out: output, shape (2, 4)
+        :type out: numpy.ndarray
+        """
+        self.rotation(float(roll), float(pitch), float(yaw), self._rot)
+        np.matmul(self._rot, self.body_struct, out=out)
+
+    def solve_rotated(self, pose, pitch):
+        """
+        Second half of solve, from the rotated shoulders in the body buffer
+
+        :param pose: body position x, y, z, mm
+        :param pitch: body pitch, radians
+        :return: servo angles of the legs, degrees, reused buffer
+        :rtype: numpy.ndarray, shape (8,)
+        """
+        pitch = float(pitch)
+        # shoulders in field frame, pose + rot * body_struct
+        pose = np.asarray(pose).flat
+        self._body_y += pose[1]
+        self._body_z += pose[2]
+
+        # foot relative to shoulder
+        y, z = self._y, self._z
+        np.subtract(self._legs_y, self._body_y, out=y)
+        np.subtract(self._body_z, self._legs_z, out=z)
+
+        leg, foot = self.leg, self.foot
+        u2, u, a, b = self._u2, self._u, self._a, self._b
+        np.multiply(y, y, out=u2)
+        np.multiply(z, z, out=a)
+        np.add(u2, a, out=u2)
+        np.sqrt(u2, out=u)
+        # foot angle, clamp cos values to [-1, 1] before acos
+        np.subtract(foot**2 + leg**2, u2, out=a)
+        a *= 1 / (2 * foot * leg)
+        np.clip(a, -1, 1, out=a)
+        np.arccos(a, out=a)
+        # leg angle, the body pitch is added like in Pidog.fieldcoord2polar
+        np.arctan2(y, z, out=b)
+        np.add(u2, leg**2 - foot**2, out=u2)
+        np.divide(u2, u, out=u2)
+        u2 *= 1 / (2 * leg)
+        np.clip(u2, -1, 1, out=u2)
+        np.arccos(u2, out=u2)
+        np.add(u2, b, out=u2)
+        u2 += pitch
+
+        np.multiply(u2, 180 / pi, out=self._leg_angles)
+        np.multiply(a, 180 / pi, out=self._foot_angles)
+        self._foot_angles -= 90
+        # The left and right sides are opposite
+        for right in self._right_angles:
+            right *= -1
+        return self.angles
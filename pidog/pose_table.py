@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+from math import pi, floor
+import numpy as np
+from .pose_solver import PoseSolver
+
+
+class PoseCorrectionTable():
+    """
+    Precomputed body rotations for small roll and pitch corrections
+
+    The rotated shoulders (y and z of the 4 shoulders, 8 values) are
+    tabulated once over a roll / pitch grid, yaw 0. Each grid cell stores
+    the coefficients of its bilinear interpolation, so a solve is one
+    [1, fi, fj, fi * fj] * (4, 8) product on a contiguous block instead of
+    computing the rotation, then finishes with the inverse kinematics of
+    PoseSolver. Poses out of the grid, or with a yaw, are solved exactly.
+
+    The grid is refined down to resolution, coarser if the table would not
+    fit in memory_budget. accuracy() measures the error against the exact
+    solve.
+    """
+
+    RESOLUTION = 0.25 # degrees between grid points
+    ROLL_LIMIT = 20 # degrees, grid covers -ROLL_LIMIT to ROLL_LIMIT
+    PITCH_LIMIT = 20 # degrees
+    MEMORY_BUDGET = 8 * 1024 * 1024 # bytes
+
+    def __init__(self, solver=None, resolution=RESOLUTION, roll_limit=ROLL_LIMIT,
+                 pitch_limit=PITCH_LIMIT, memory_budget=MEMORY_BUDGET):
+        """
+        :param solver: PoseSolver to finish the solve with, default a new one
+        :type solver: PoseSolver
+        :param resolution: grid step, degrees
+        :type resolution: float
+        :param roll_limit: roll range of the grid, degrees
+        :type roll_limit: float or int
+        :param pitch_limit: pitch range of the grid, degrees
+        :type pitch_limit: float or int
+        :param memory_budget: max size of the table, bytes
+        :type memory_budget: int
+        """
+        self.solver = solver if solver is not None else PoseSolver()
+        self.roll_limit = roll_limit
+        self.pitch_limit = pitch_limit
+        self.memory_budget = memory_budget
+
+        # coarsen until the table fits
+        cell_bytes = 4 * 8 * np.dtype(float).itemsize
+        while self._grid_size(resolution) * cell_bytes > memory_budget:
+            resolution *= 2
+        self.resolution = resolution
+        self.table = self._build()
+
+        self._weights = np.ones(4)
+        self._body = self.solver.body.reshape(8) # view
+        self.lookups = 0
+        self.fallbacks = 0 # exact solves, out of the grid or yaw
+
+    def _grid_size(self, resolution):
+        # number of cells
+        return int(round(2 * self.roll_limit / resolution)) * \
+            int(round(2 * self.pitch_limit / resolution))
+
+    def _build(self):
+        n_roll = int(round(2 * self.roll_limit / self.resolution)) + 1
+        n_pitch = int(round(2 * self.pitch_limit / self.resolution)) + 1
+        roll = (-self.roll_limit + self.resolution * np.arange(n_roll)) / 180 * pi
+        pitch = (-self.pitch_limit + self.resolution * np.arange(n_pitch)) / 180 * pi
+        cr, sr = np.cos(roll)[:, None], np.sin(roll)[:, None]
+        cp, sp = np.cos(-pitch)[None, :], np.sin(-pitch)[None, :]
+        # PoseSolver.rotation with yaw 0, for all grid points at once
+        rot = np.zeros((n_roll, n_pitch, 2, 3))
+        rot[:, :, 0, 1] = cp
+        rot[:, :, 0, 2] = -sp
+        rot[:, :, 1, 0] = sr
+        rot[:, :, 1, 1] = cr * sp
+        rot[:, :, 1, 2] = cr * cp
+        points = np.matmul(rot, self.solver.body_struct).reshape(n_roll, n_pitch, 8)
+
+        # p = c0 + c1 * fi + c2 * fj + c3 * fi * fj inside each cell
+        p00, p10 = points[:-1, :-1], points[1:, :-1]
+        p01, p11 = points[:-1, 1:], points[1:, 1:]
+        return np.ascontiguousarray(np.stack(
+            [p00, p10 - p00, p01 - p00, p11 - p10 - p01 + p00], axis=2))
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def solve(self, pose, rpy):
+        """
+        Legs angles for a body pose, same as PoseSolver.solve
+
+        :param pose: body position x, y, z, mm
+        :param rpy: roll, pitch, yaw, radians
+        :return: servo angles of the legs, degrees, reused buffer
+        :rtype: numpy.ndarray, shape (8,)
+        """
+        roll = float(rpy[0]) / pi * 180 + self.roll_limit
+        pitch = float(rpy[1]) / pi * 180 + self.pitch_limit
+        i = roll / self.resolution
+        j = pitch / self.resolution
+        i0, j0 = floor(i), floor(j)
+        if rpy[2] != 0 or i0 < 0 or j0 < 0 or \
+                i0 >= self.table.shape[0] or j0 >= self.table.shape[1]:
+            self.fallbacks += 1
+            return self.solver.solve(pose, rpy)
+        self.lookups += 1
+
+        # bilinear interpolation in the cell, into the solver body buffer
+        fi, fj = i - i0, j - j0
+        weights = self._weights
+        weights[1] = fi
+        weights[2] = fj
+        weights[3] = fi * fj
+        np.matmul(weights, self.table[i0, j0], out=self._body)
+        return self.solver.solve_rotated(pose, rpy[1])
+
+    def accuracy(self, legs_list, body_height, samples=1000, seed=0):
+        """
+        Error of the table against the exact solve, over random roll and
+        pitch within the grid
+
+        :param legs_list: [y, z] of each foot, 4 legs, see PoseSolver.set_legs
+        :type legs_list: list
+        :param body_height: body height, mm
+        :type body_height: float or int
+        :param samples: number of random poses
+        :type samples: int
+        :param seed: random seed
+        :type seed: int
+        :return: max and mean angle errors (degrees), resolution and table size
+        :rtype: dict
+        """
+        exact = PoseSolver(self.solver.leg, self.solver.foot)
+        exact.body_struct = self.solver.body_struct
+        exact.set_legs(legs_list, body_height)
+        # the solver may be the one of a Pidog, put its legs back after
+        saved_legs = self.solver.legs.copy()
+        self.solver.set_legs(legs_list, body_height)
+        pose = [0.0, 0.0, body_height]
+
+        rng = np.random.default_rng(seed)
+        rolls = rng.uniform(-self.roll_limit, self.roll_limit, samples) / 180 * pi
+        pitches = rng.uniform(-self.pitch_limit, self.pitch_limit, samples) / 180 * pi
+        errors = np.zeros(samples)
+        for k in range(samples):
+            rpy = (rolls[k], pitches[k], 0.0)
+            expected = exact.solve(pose, rpy)
+            errors[k] = np.abs(self.solve(pose, rpy) - expected).max()
+        self.solver.legs[...] = saved_legs
+        return {
+            'max_error': float(errors.max()),
+            'mean_error': float(errors.mean()),
+            'resolution': self.resolution,
+            'bytes': self.nbytes,
+        }
+
+    def stats(self):
+        """
+        :return: table lookups and exact fallbacks
+        :rtype: dict
+        """
+        return {
+            'lookups': self.lookups,
+            'fallbacks': self.fallbacks,
+            'resolution': self.resolution,
+            'bytes': self.nbytes,
+        }
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+from collections import deque
+
+
+class RangeFilter():
+    """
+    Rolling median of the ultrasonic readings with outlier rejection
+
+    Timeouts (-1) and readings out of range are invalid. The distance is the
+    median of the valid readings of the last window readings, so single
+    spikes are rejected and a real change is followed after window // 2 + 1
+    readings. The confidence is the share of the window that is valid and
+    agrees with the median.
+    """
+
+    WINDOW = 5
+    MIN_DISTANCE = 2 # cm, closer readings are unreliable
+    MAX_DISTANCE = 400 # cm
+    OUTLIER_DISTANCE = 10 # cm, readings further than this from the median are outliers,
+    OUTLIER_RATIO = 0.2 # or further than this ratio of the median, whichever is larger
+
+    def __init__(self, window=WINDOW):
+        """
+        :param window: number of readings kept
+        :type window: int
+        """
+        self.readings = deque(maxlen=window)
+        self.outliers = 0 # total number of outliers rejected
+
+    def is_valid(self, distance):
+        return self.MIN_DISTANCE <= distance <= self.MAX_DISTANCE
+
+    def is_outlier(self, distance, median):
+        return abs(distance - median) > max(self.OUTLIER_DISTANCE, self.OUTLIER_RATIO * median)
+
+    def add(self, distance):
+        """
+        Add a raw reading
+
+        :param distance: raw distance, cm, -1 for timeout
+        :type distance: float
+        :return: filtered distance (-1 if no valid reading in the window) and confidence, 0-1
+        :rtype: tuple
+        """
+        distance = float(distance)
+        self.readings.append(distance if self.is_valid(distance) else None)
+        valid = sorted(d for d in self.readings if d is not None)
+        if len(valid) == 0:
+            return -1.0, 0.0
+        n = len(valid)
+        median = valid[n // 2] if n % 2 else (valid[n // 2 - 1] + valid[n // 2]) / 2
+        if self.readings[-1] is not None and self.is_outlier(self.readings[-1], median):
+            self.outliers += 1
+        agree = sum(1 for d in valid if not self.is_outlier(d, median))
+        return round(median, 2), agree / self.readings.maxlen
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import time
-from smbus import SMBus
 import numpy as np
 import math
+from collections import OrderedDict
 
 class RGBStrip():
     # preset colors define
@@ -29,6 +29,10 @@ class RGBStrip():
     ]
 
     MIN_DELAY = 0.05
+    FRAME_CACHE_SIZE = 16 # max number of style frame tables kept in cache
+
+    I2C_BLOCK_MAX = 32 # max data bytes of one smbus block write
+    PAGE_SIZE = 0x100
 
     # region constants
     CONFIGURE_CMD_PAGE = 0XFD
@@ -95,10 +99,11 @@ class RGBStrip():
     ]
     # endregion constants
 
-    def __init__(self, addr=0X74, nums=8):
+    def __init__(self, addr=0X74, nums=8, bus=None):
         """
         :param addr: i2c address
         :nums: number of lights
+        :bus: smbus.SMBus like object, default SMBus(1)
         """
         self.light_num = nums
 
@@ -110,10 +115,19 @@ class RGBStrip():
         self.current_frame = 0
         self.bps = 1.5 # beats per second
         self.is_changed = False
+        self._frame_cache = OrderedDict()
+
+        # shadow copy of the frame pages, to send only what changed
+        # page -> PAGE_SIZE values, None where the content is unknown
+        self._page = None # selected ram page, None if unknown
+        self._ram = {}
 
         # Initial
         # =================================================================
-        self.bus = SMBus(1)
+        if bus is None:
+            from smbus import SMBus
+            bus = SMBus(1)
+        self.bus = bus
         self.addr = addr
 
         # Setting SLED1735 Ram Page to Function Page
@@ -158,17 +172,75 @@ class RGBStrip():
     # =================================================================
     def write_cmd(self, reg, cmd):
         self.bus.write_byte_data(self.addr, reg, cmd)
+        if reg == self.CONFIGURE_CMD_PAGE:
+            self._page = cmd
+        else:
+            self._shadow_update(reg, [cmd])
 
     def write_Ndata(self, startaddr, data, length):
-        addr = startaddr
+        """
+        Write length bytes from startaddr of the current page, in block writes
+
+        :param startaddr: start register
+        :type startaddr: int
+        :param data: value to fill with, or list of values
+        :type data: int or list
+        :param length: number of bytes
+        :type length: int
+        """
         if isinstance(data, int):
-            for i in range(length):
-                self.write_cmd(addr, data)
-                addr += 1
-        elif isinstance(data, list):
-            for i in range(length):
-                self.write_cmd(addr, data[i])
-                addr += 1
+            data = [data] * length
+        else:
+            data = list(data[:length])
+        for i in range(0, length, self.I2C_BLOCK_MAX):
+            self.write_block(startaddr + i, data[i:i + self.I2C_BLOCK_MAX])
+
+    def write_block(self, reg, data):
+        self.bus.write_i2c_block_data(self.addr, reg, data)
+        self._shadow_update(reg, data)
+
+    def select_page(self, page):
+        """
+        Select the ram page, skipped if it is already selected
+        """
+        if self._page != page:
+            self.write_cmd(self.CONFIGURE_CMD_PAGE, page)
+
+    def invalidate(self):
+        """
+        Forget the shadow ram, eg. after the chip has been reset,
+        so that the next writes are all sent
+        """
+        self._page = None
+        self._ram.clear()
+
+    def _shadow_update(self, reg, data):
+        if self._page not in (self.FRAME1_PAGE, self.FRAME2_PAGE):
+            return
+        ram = self._ram.setdefault(self._page, [None] * self.PAGE_SIZE)
+        ram[reg:reg + len(data)] = data
+
+    def write_row(self, page, reg, data):
+        """
+        Write data to a frame page, only the span that differs from the shadow ram
+
+        :return: True if written
+        :rtype: bool
+        """
+        ram = self._ram.get(page)
+        start, end = 0, len(data)
+        if ram is not None:
+            # trim to the changed span
+            old = ram[reg:reg + len(data)]
+            while start < end and old[start] == data[start]:
+                start += 1
+            if start == end:
+                return False
+            while old[end - 1] == data[end - 1]:
+                end -= 1
+        self.select_page(page)
+        self.write_block(reg + start, data[start:end])
+        return True
 
     # display fuction
     # =================================================================
@@ -176,38 +248,24 @@ class RGBStrip():
         """
         Display the rgb datas
 
+        Each color is one 16-byte row of frame 1 (reds at 0x20, greens at
+        0x30, blues at 0x40, the first 2 bytes of a row are 0), only the
+        rows that changed since the last write are sent.
+
         :param image: rgb datas, should be a x*3 array 
-        :type image: list [[r, g, b], [r, g, b], ...]
+        :type image: list [[r, g, b], [r, g, b], ...] or numpy.ndarray
         """
-        # 'lambda x: x[0]'  same as  'fun(x): return x[0]'
-        reds = list(map(lambda x: x[0], image))
-        greens = list(map(lambda x: x[1], image))
-        blues = list(map(lambda x: x[2], image))
-        revert_image = [reds, greens, blues]
+        image = np.asarray(image)
+        if image.size == 0:
+            return
+        # up to 14 lights per row
+        image = np.clip(image[:14], 0, 255).astype(int)
 
         reg = 0x20  # Register start address of a page
-        empty = 0  # Register address vacancy position (needs to be filled with 0)
-        pos = 0  # data position, index
-
-        for i in range(3):
-            # Set the page to write
-            if i == 0:
-                self.write_cmd(self.CONFIGURE_CMD_PAGE, self.FRAME1_PAGE)  
-            elif reg == 0x20:
-                self.write_cmd(self.CONFIGURE_CMD_PAGE, self.FRAME2_PAGE)
-
-            color = i % 3
-            data = revert_image[color][pos*14:(pos+1)*14]
-            data.insert(empty, 0)  # The written data is filled with 0
-            data.insert(empty + 1, 0)
-
-            self.bus.write_i2c_block_data(self.addr, reg, data)
-            if color == 2:
-                empty += 3
-                pos += 1
+        for color in range(3):
+            data = [0, 0] + image[:, color].tolist()
+            self.write_row(self.FRAME1_PAGE, reg, data)
             reg += 0x10
-            if reg == 0xA0:
-                reg = 0x20
 
     # 
     # calulate rgb data of different styles
@@ -437,21 +495,78 @@ class RGBStrip():
         elif self.style == 'listen':
             return self.listen(frame_index, light_index, color=self.color)
 
+    def style_brightness(self, style, max_frames):
+        """
+        Brightness of each light in each frame, the vectorized version of the
+        style functions above
+
+        :return: max_frames*light_num array, None for monochromatic
+        :rtype: numpy.ndarray
+        """
+        f = np.arange(max_frames, dtype=float)[:, None]
+        x = np.arange(self.light_num, dtype=float)[None, :]
+        if style == 'breath' or style == 'boom':
+            u, A, sig = 5, 5, 2
+            periods = 1 if style == 'breath' else 2
+            multiple = float(2*math.pi/(max_frames*float(periods)))
+            offset = -((1/2.0) * np.cos(multiple*f) + 1/2)
+            return self.Normal_distribution_calculate(u, sig, A, x, offset)
+        elif style == 'bark' or style == 'speak':
+            A, sig = 2.5, 1
+            peak = (self.light_num-1)/2
+            periods = 2 if style == 'bark' else 1
+            multiple = float(2*math.pi/(max_frames*float(periods)))
+            u_offset = (peak/2.0) * np.cos(multiple*f) + peak/2
+            u = np.where(x <= peak, u_offset, 2*peak - u_offset)
+            return self.Normal_distribution_calculate(u, sig, A, x, 0)
+        elif style == 'listen':
+            A, sig = 2.5, 1
+            peak = self.light_num-1
+            multiple = float(2*math.pi/(max_frames))
+            u = (peak/2.0) * np.cos(multiple*f + math.pi/2) + peak/2
+            return self.Normal_distribution_calculate(u, sig, A, x, 0)
+        return None
+
+    def style_frames(self, style, color, bps, brightness):
+        """
+        Frames of a style, computed once and then cached (LRU)
+
+        :return: frames*light_num*3 array of [r, g, b]
+        :rtype: numpy.ndarray, uint8
+        """
+        key = (style, tuple(color), bps, brightness, self.light_num)
+        frames = self._frame_cache.get(key)
+        if frames is not None:
+            self._frame_cache.move_to_end(key)
+            return frames
+
+        max_frames = int(1/bps/self.MIN_DELAY)
+        color = np.array([i*brightness for i in color], dtype=float)
+        light_brightness = self.style_brightness(style, max_frames)
+        if light_brightness is None:
+            # monochromatic
+            values = np.broadcast_to(color, (max_frames, self.light_num, 3))
+        else:
+            values = color * light_brightness[:, :, None]
+        # same as max(0, int(c * brightness)) of the style functions
+        frames = np.clip(np.trunc(values), 0, 255).astype(np.uint8)
+        frames.flags.writeable = False
+
+        self._frame_cache[key] = frames
+        if len(self._frame_cache) > self.FRAME_CACHE_SIZE:
+            self._frame_cache.popitem(last=False)
+        return frames
+
     def show(self):
         if self.style is not None:
-            # if changed, calulate frames
+            # if changed, get the frames
             if self.is_changed:
                 self.is_changed = False
-                self.frames.clear()
-                self.max_frames = int(1/self.bps/self.MIN_DELAY)
-                for frame_index in range(self.max_frames):
-                    frame = [] # 11*[r, g ,b]
-                    for light_index in range(self.light_num):
-                        _data = self.calulate_data(frame_index, light_index)
-                        frame.append(_data)
-                    if __name__ == '__main__':
-                        print(f"{frame_index}:{frame}")
-                    self.frames.append(frame)
+                self.frames = self.style_frames(self.style, self.color, self.bps, self.brightness)
+                self.max_frames = len(self.frames)
+                if __name__ == '__main__':
+                    for frame_index, frame in enumerate(self.frames):
+                        print(f"{frame_index}:{frame.tolist()}")
             # dispaly frame-by-frame, to quickly change mode or close 
             if self.current_frame >= self.max_frames:
                 self.current_frame = 0
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+'''
+Shared memory sensor bus
+
+One fixed layout block of shared memory holding the latest value of each
+sensor with its timestamp. Pidog writes it, any process can attach to it by
+name and read it without locks:
+
+    from pidog.sensor_bus import SensorBus
+
+    bus = SensorBus(name=my_dog.sensor_bus.name, create=False)
+    (distance, confidence), t = bus.read('distance')
+
+Each field is a seqlock record [seq, t, values...]: the writer makes seq odd,
+writes, then makes it even again; readers retry while seq is odd or changed
+during the read. A field must only be written by one process, writes from
+several threads of that process are serialized. Readers can wait for the
+next write of a field with wait_update().
+'''
+import struct
+import threading
+from time import sleep, monotonic
+from multiprocessing import shared_memory
+
+
+class SensorBus():
+    """
+    Latest sensor values in shared memory
+    """
+
+    MAGIC = b'PDSB'
+    LAYOUT_VERSION = 2
+    HEADER = struct.Struct('<4sI')
+    SEQ = struct.Struct('<Q')
+
+    # name -> (struct format of the values, default values)
+    FIELDS = {
+        'distance': ('2d', (-1.0, 0.0)), # filtered distance (cm, -1 for none), confidence (0-1)
+        'imu': ('6d', (0.0,)*6), # ax, ay, az, gx, gy, gz, offset corrected raw data
+        'attitude': ('2d', (0.0, 0.0)), # pitch, roll, degrees
+        'touch': ('4s', (b'N',)), # 'N', 'L', 'R', 'LS' or 'RS'
+        'sound_direction': ('i', (-1,)), # degrees, -1 for none
+        'battery': ('d', (0.0,)), # volts
+        'motion': ('?', (False,)), # legs moving, sets the ultrasonic rate
+    }
+
+    READ_RETRIES = 1000
+    WAIT_POLL = 0.002 # seconds between two checks in wait_update
+
+    def __init__(self, name=None, create=True):
+        """
+        :param name: shared memory name, None for a new unique name
+        :type name: str
+        :param create: create the block, or attach to an existing one
+        :type create: bool
+        """
+        self._records = {}
+        offset = self.HEADER.size
+        for field, (fmt, default) in self.FIELDS.items():
+            record = struct.Struct('<Qd' + fmt)
+            self._records[field] = (offset, record)
+            # keep the records 8 bytes aligned
+            offset += (record.size + 7) // 8 * 8
+        self.size = offset
+        self._write_locks = {field: threading.Lock() for field in self.FIELDS}
+
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=self.size)
+            self.buf = self.shm.buf
+            self.buf[:self.size] = bytes(self.size)
+            self.HEADER.pack_into(self.buf, 0, self.MAGIC, self.LAYOUT_VERSION)
+        else:
+            self.shm = self._attach(name)
+            self.buf = self.shm.buf
+            magic, version = self.HEADER.unpack_from(self.buf, 0)
+            if magic != self.MAGIC or version != self.LAYOUT_VERSION:
+                self.shm.close()
+                raise ValueError(f"{name} is not a sensor bus of layout version {self.LAYOUT_VERSION}")
+        self.owner = create
+        self.name = self.shm.name
+
+    @staticmethod
+    def _attach(name):
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # python < 3.13, do not let the resource tracker of this process
+            # unlink the block of the owner at exit
+            from multiprocessing import resource_tracker
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            return shm
+
+    def __reduce__(self):
+        # child processes attach to the same block
+        return (self.__class__, (self.name, False))
+
+    def write(self, field, *values, t=None):
+        """
+        Publish the values of a field
+
+        :param field: field name, see FIELDS
+        :type field: str
+        :param values: values of the field
+        :param t: timestamp, seconds, default time.monotonic()
+        :type t: float
+        """
+        offset, record = self._records[field]
+        if field == 'touch':
+            values = (values[0].encode(),)
+        if t is None:
+            t = monotonic()
+        with self._write_locks[field]:
+            seq = self.SEQ.unpack_from(self.buf, offset)[0]
+            self.SEQ.pack_into(self.buf, offset, seq + 1)
+            record.pack_into(self.buf, offset, seq + 1, t, *values)
+            self.SEQ.pack_into(self.buf, offset, seq + 2)
+
+    def read(self, field):
+        """
+        Latest values of a field
+
+        :param field: field name, see FIELDS
+        :type field: str
+        :return: value (tuple for fields with several values) and its
+            timestamp, None if never written
+        :rtype: tuple
+        """
+        value, t, _ = self.read_record(field)
+        return value, t
+
+    def read_record(self, field):
+        """
+        Same as read, with the sequence number of the record, which grows
+        with each write
+
+        :return: value, timestamp and sequence number
+        :rtype: tuple
+        """
+        offset, record = self._records[field]
+        for _ in range(self.READ_RETRIES):
+            seq, t, *values = record.unpack_from(self.buf, offset)
+            if seq & 1 or self.SEQ.unpack_from(self.buf, offset)[0] != seq:
+                # being written
+                sleep(0)
+                continue
+            if seq == 0:
+                t, values = None, list(self.FIELDS[field][1])
+            if field == 'touch':
+                values = [values[0].rstrip(b'\x00').decode()]
+            return (values[0] if len(values) == 1 else tuple(values)), t, seq
+        raise TimeoutError(f"sensor bus field '{field}' is locked by its writer")
+
+    def wait_update(self, field, seq=None, timeout=None):
+        """
+        Wait for a write of a field newer than the sequence number seq
+
+        :param field: field name, see FIELDS
+        :type field: str
+        :param seq: sequence number from read_record, None for the current one
+        :type seq: int
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: value, timestamp and sequence number, None on timeout
+        :rtype: tuple
+        """
+        offset, _ = self._records[field]
+        if seq is None:
+            seq = self.read_record(field)[2]
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            current = self.SEQ.unpack_from(self.buf, offset)[0]
+            if current > seq and not current & 1:
+                return self.read_record(field)
+            if deadline is not None and monotonic() >= deadline:
+                return None
+            sleep(self.WAIT_POLL)
+
+    def read_all(self):
+        """
+        :return: field -> (value, timestamp)
+        :rtype: dict
+        """
+        return {field: self.read(field) for field in self.FIELDS}
+
+    def close(self):
+        """
+        Detach, the owner also removes the shared memory block
+        """
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+'''
+Sensory subprocess
+
+Reads the ultrasonic sensor in its own process and publishes the filtered
+distance and its confidence on the SensorBus, fast while the legs move and
+slower when the robot stands still. The worker is a fresh interpreter
+running this module (python -m pidog.sensory_worker), it only imports this
+module, the backend and the sensor bus, not the Pidog object or the script
+that created it.
+
+The parent sends the pickled (backend, sensor_bus, intervals) on the worker
+stdin and keeps the pipe open. Closing it is the stop signal, so the
+worker also exits by itself if the parent dies. A supervisor thread in the
+parent restarts the worker when it dies, terminate() is only a fallback
+for a worker stuck in a read.
+'''
+import os
+import sys
+import pickle
+import threading
+import subprocess
+from .ranging import RangeFilter
+
+
+def ultrasonic_worker(backend, sensor_bus, stop_event, intervals=(0.01, 0.05)):
+    """
+    Worker loop, runs until stop_event is set
+
+    :param backend: Backend providing the ultrasonic sensor
+    :param sensor_bus: SensorBus to publish on
+    :param stop_event: threading.Event
+    :param intervals: seconds between two reads while moving and while still
+    :type intervals: tuple
+    """
+    ultrasonic = backend.ultrasonic(trig='D1', echo='D0', timeout=0.017)
+    range_filter = RangeFilter()
+    try:
+        while not stop_event.is_set():
+            raw = ultrasonic.read()
+            distance, confidence = range_filter.add(raw)
+            sensor_bus.write('distance', distance, confidence, t=backend.time())
+            moving = sensor_bus.read('motion')[0]
+            stop_event.wait(intervals[0] if moving else intervals[1])
+    finally:
+        sensor_bus.close()
+
+
+def main():
+    backend, sensor_bus, intervals = pickle.load(sys.stdin.buffer)
+
+    stop_event = threading.Event()
+    def wait_parent():
+        # returns when the parent closes the pipe or exits
+        sys.stdin.buffer.read()
+        stop_event.set()
+    threading.Thread(name='wait_parent_thread', target=wait_parent, daemon=True).start()
+
+    ultrasonic_worker(backend, sensor_bus, stop_event, intervals)
+
+
+class SensoryWorker():
+    """
+    Supervised sensory subprocess
+    """
+
+    MODULE = 'pidog.sensory_worker'
+    RESTART_DELAY = 1.0 # seconds before restarting a dead worker
+    STOP_TIMEOUT = 2.0 # seconds to wait for the worker to exit before terminating it
+
+    def __init__(self, backend, sensor_bus, intervals=(0.01, 0.05), max_restarts=None):
+        """
+        :param backend: Backend, must be picklable
+        :param sensor_bus: SensorBus to publish on
+        :param intervals: seconds between two ultrasonic reads, while moving and while still
+        :type intervals: tuple
+        :param max_restarts: give up after this many restarts, None to always restart
+        :type max_restarts: int
+        """
+        self.backend = backend
+        self.sensor_bus = sensor_bus
+        self.intervals = intervals
+        self.max_restarts = max_restarts
+
+        self.process = None
+        self.restarts = 0
+        self._stopping = threading.Event()
+        self._supervisor = None
+
+    def _spawn(self):
+        # same module search path as this process, like multiprocessing spawn
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        self.process = subprocess.Popen([sys.executable, '-m', self.MODULE],
+                                        stdin=subprocess.PIPE, env=env)
+        try:
+            pickle.dump((self.backend, self.sensor_bus, self.intervals), self.process.stdin)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            # died at startup, the supervisor will see it
+            pass
+
+    def _supervise(self):
+        while not self._stopping.is_set():
+            try:
+                self.process.wait(0.5)
+            except subprocess.TimeoutExpired:
+                continue
+            if self._stopping.is_set():
+                break
+            if self.max_restarts is not None and self.restarts >= self.max_restarts:
+                print(f'\033[0;31m\rsensory_process exited ({self.process.returncode}), giving up\033[0m')
+                break
+            print(f'\033[0;31m\rsensory_process exited ({self.process.returncode}), restarting\033[0m')
+            if self._stopping.wait(self.RESTART_DELAY):
+                break
+            self._close_pipe()
+            self.restarts += 1
+            self._spawn()
+
+    def _close_pipe(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        if self.is_alive():
+            return
+        self._stopping.clear()
+        self._spawn()
+        self._supervisor = threading.Thread(name='sensory_supervisor_thread', target=self._supervise)
+        self._supervisor.daemon = True
+        self._supervisor.start()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Ask the worker to exit and wait for it
+
+        :return: True if it exited by itself, False if it had to be terminated
+        :rtype: bool
+        """
+        self._stopping.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+            self._supervisor = None
+        if self.process is None:
+            return True
+        self._close_pipe()
+        try:
+            self.process.wait(timeout)
+            clean = True
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            self.process.wait()
+            clean = False
+        self.process = None
+        return clean
+
+
+if __name__ == '__main__':
+    main()
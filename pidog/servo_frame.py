@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+
+class ServoFrameWriter():
+    """
+    Frame commit for the servo scheduler
+
+    Gathers the angles of all servo groups of one tick, converts them to pwm
+    pulse widths like robot_hat.Servo does, and writes only the changed
+    channels. With auto_increment, consecutive channels are sent in one i2c
+    block transaction, otherwise one transaction per changed channel.
+    """
+
+    REG_CHN = 0x20 # pwm channel pulse width register of the Robot HAT mcu
+    PERIOD = 4095
+    MIN_PW = 500 # us
+    MAX_PW = 2500 # us
+    FRAME_TIME = 20000 # us
+
+    def __init__(self, write_block, auto_increment=False):
+        """
+        :param write_block: function(reg, data) doing one i2c write transaction
+        :type write_block: function
+        :param auto_increment: whether the pwm controller accepts consecutive channels in one block write
+        :type auto_increment: bool
+        """
+        self.write_block = write_block
+        self.auto_increment = auto_increment
+        self._last = {} # channel -> last written pulse width
+        # statistics
+        self.frames = 0
+        self.transactions = 0
+        self.channels_written = 0
+
+    @staticmethod
+    def channel_of(pin):
+        if isinstance(pin, str):
+            return int(pin.strip('Pp'))
+        return int(pin)
+
+    def pulse_width(self, angle):
+        angle = min(90, max(-90, angle))
+        pulse_width_time = (angle + 90) / 180 * (self.MAX_PW - self.MIN_PW) + self.MIN_PW
+        return int(pulse_width_time / self.FRAME_TIME * self.PERIOD)
+
+    def frame_pulse_widths(self, frame):
+        """
+        :param frame: list of (group, positions), as given by ServoScheduler
+        :return: channel -> pulse width
+        :rtype: dict
+        """
+        values = {}
+        for group, positions in frame:
+            servos = group.servos
+            pin_num = len(servos.pin_list)
+            # same as robot_hat.Robot.servo_write_all
+            direction = getattr(servos, 'direction', [1] * pin_num)
+            origin = getattr(servos, 'origin_positions', [0] * pin_num)
+            for i in range(pin_num):
+                angle = direction[i] * (origin[i] + positions[i] + servos.offset[i])
+                values[self.channel_of(servos.pin_list[i])] = self.pulse_width(angle)
+        return values
+
+    def __call__(self, frame):
+        values = self.frame_pulse_widths(frame)
+        channels = sorted(ch for ch, value in values.items() if self._last.get(ch) != value)
+
+        # split the changed channels into runs of consecutive channels
+        runs = []
+        for ch in channels:
+            if self.auto_increment and runs and runs[-1][-1] == ch - 1:
+                runs[-1].append(ch)
+            else:
+                runs.append([ch])
+
+        for run in runs:
+            data = []
+            for ch in run:
+                data += [values[ch] >> 8, values[ch] & 0xff]
+            self.write_block(self.REG_CHN + run[0], data)
+            for ch in run:
+                self._last[ch] = values[ch]
+
+        self.frames += 1
+        self.transactions += len(runs)
+        self.channels_written += len(channels)
+
+    def stats(self):
+        """
+        :return: frames, i2c transactions and channels written
+        :rtype: dict
+        """
+        return {
+            'frames': self.frames,
+            'transactions': self.transactions,
+            'channels_written': self.channels_written,
+        }
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+import threading
+from time import sleep, monotonic
+
+
+class ServoGroup():
+    """
+    One group of servos (legs, head or tail) fed by an ActionBuffer
+    """
+
+    def __init__(self, name, servos, buffer, speed=None, transform=None, on_keyframe=None):
+        """
+        :param name: group name
+        :type name: str
+        :param servos: robot_hat.Robot like servo group
+        :param buffer: ActionBuffer of keyframes
+        :param speed: function returning the current speed, 0-100
+        :type speed: function
+        :param transform: function converting a keyframe to servo angles
+        :type transform: function
+        :param on_keyframe: called with the keyframe when it starts
+        :type on_keyframe: function
+        """
+        self.name = name
+        self.servos = servos
+        self.buffer = buffer
+        self.speed = speed if speed is not None else lambda: 50
+        self.transform = transform
+        self.on_keyframe = on_keyframe
+
+        self.positions = list(servos.servo_positions)
+        self.start_positions = None
+        self.target = None
+        self.start_time = 0
+        self.duration = 0
+
+    def keyframe_duration(self, start, target, speed=None):
+        """
+        Keyframe duration in seconds, same as robot_hat.Robot.servo_move timing
+
+        :param speed: speed of the keyframe, default the speed of the group
+        :type speed: float or int
+        """
+        max_delta = max(abs(t - s) for s, t in zip(start, target))
+        if speed is None:
+            speed = self.speed()
+        speed = min(100, max(0, speed))
+        total_time = -9.9 * speed + 1000 # ms
+        if max_delta / total_time * 1000 > self.servos.max_dps:
+            total_time = max_delta / self.servos.max_dps * 1000
+        return total_time / 1000
+
+    def next_keyframe(self, start_time):
+        frame = self.buffer.get(timeout=0)
+        if frame is None:
+            self.target = None
+            return False
+        if self.on_keyframe is not None:
+            self.on_keyframe(frame)
+        # eg. transitions.Keyframe
+        speed = getattr(frame, 'speed', None)
+        if self.transform is not None:
+            frame = self.transform(frame)
+        self.start_positions = list(self.positions)
+        # extra values are ignored, like robot_hat.Robot.servo_move
+        self.target = list(frame)[:len(self.positions)]
+        self.start_time = start_time
+        self.duration = self.keyframe_duration(self.start_positions, self.target, speed)
+        return True
+
+    def update(self, now):
+        """
+        Interpolate the positions at time now
+
+        :return: True if the positions changed
+        :rtype: bool
+        """
+        if self.target is None and not self.next_keyframe(now):
+            return False
+        # finished keyframes hand their leftover time to the next one
+        while now - self.start_time >= self.duration:
+            end_time = self.start_time + self.duration
+            self.positions = self.target
+            self.buffer.task_done()
+            if not self.next_keyframe(end_time):
+                return True
+        ratio = (now - self.start_time) / self.duration
+        self.positions = [s + (t - s) * ratio for s, t in zip(self.start_positions, self.target)]
+        return True
+
+    def is_idle(self):
+        return self.target is None and len(self.buffer) == 0
+
+    def release(self):
+        """
+        Drop the current keyframe, eg. when the scheduler stops
+        """
+        if self.target is not None:
+            self.target = None
+            self.buffer.task_done()
+
+
+class ServoScheduler():
+    """
+    Fixed-rate servo scheduler
+
+    Runs at a fixed tick, interpolates between the keyframes queued in the
+    groups' action buffers and writes all the servos in one batch per tick.
+    Sleeps while all buffers are empty.
+    """
+
+    DEFAULT_HZ = 100
+
+    def __init__(self, hz=DEFAULT_HZ, write=None, clock=monotonic, sleep=sleep):
+        """
+        :param hz: tick rate
+        :type hz: int or float
+        :param write: function writing one tick, called with a list of (group, positions), default servo_write_all of each group
+        :type write: function
+        :param clock: clock function, seconds
+        :type clock: function
+        :param sleep: sleep function, seconds
+        :type sleep: function
+        """
+        self.hz = hz
+        self.period = 1.0 / hz
+        self.write = write if write is not None else self.write_groups
+        self.clock = clock
+        self.sleep = sleep
+        self.groups = []
+
+        self._wake = threading.Event()
+        self._thread = None
+        self.running = False
+
+        self.ticks = 0
+        self.overruns = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+
+    def add_group(self, name, servos, buffer, speed=None, transform=None, on_keyframe=None):
+        group = ServoGroup(name, servos, buffer, speed, transform, on_keyframe)
+        buffer.add_listener(self._wake)
+        self.groups.append(group)
+        return group
+
+    @staticmethod
+    def write_groups(frame):
+        for group, positions in frame:
+            group.servos.servo_write_all(positions)
+
+    def tick(self, now):
+        frame = []
+        for group in self.groups:
+            if group.update(now):
+                frame.append((group, group.positions))
+        if frame:
+            self.write(frame)
+            for group, positions in frame:
+                group.servos.servo_positions = list(positions)
+        return len(frame) > 0
+
+    def _run(self):
+        next_tick = self.clock()
+        while self.running:
+            now = self.clock()
+            late = now - next_tick
+            if late > self.period:
+                # missed whole ticks, resync instead of bursting to catch up
+                self.overruns += 1
+                next_tick = now
+            elif late > 0:
+                self.jitter_sum += late
+                self.jitter_max = max(self.jitter_max, late)
+            self.ticks += 1
+
+            active = self.tick(now)
+            if not active and all(group.is_idle() for group in self.groups):
+                self._wake.clear()
+                # check again after clear, frames may have arrived meanwhile
+                if all(group.is_idle() for group in self.groups):
+                    self._wake.wait()
+                next_tick = self.clock()
+                continue
+
+            next_tick += self.period
+            delay = next_tick - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(name='servo_scheduler_thread', target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for group in self.groups:
+            group.release()
+
+    def stats(self):
+        """
+        Timing statistics
+
+        :return: ticks, overruns, mean and max jitter (seconds)
+        :rtype: dict
+        """
+        ticks = max(1, self.ticks)
+        return {
+            'hz': self.hz,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'jitter_mean': self.jitter_sum / ticks,
+            'jitter_max': self.jitter_max,
+        }
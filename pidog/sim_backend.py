@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+'''
+Simulated hardware backend
+
+Runs Pidog without the robot: servo writes, i2c transfers, sounds and shell
+commands are recorded with timestamps, sensors play back scripted streams.
+
+    from pidog import Pidog
+    from pidog.sim_backend import SimBackend
+
+    sim = SimBackend(distance_stream=[100, 50, 12, 8], speedup=20)
+    dog = Pidog(backend=sim)
+    dog.do_action('forward', speed=90)
+    dog.wait_all_done()
+    print(sim.servo_log[-1])
+
+Times are on the backend clock: with speedup=N, simulated servo moves take
+1/N of the real time, and timestamps are scaled up by N so they still read
+as robot time.
+'''
+import threading
+from time import sleep, monotonic
+from .backend import Backend
+from .servo_frame import ServoFrameWriter
+from .rgb_strip import RGBStrip
+from .dual_touch import DualTouch
+from .sound_direction import SoundDirection
+
+
+class ScriptedStream():
+    """
+    Play back a list of values, one per read
+
+    The last value is held when the list runs out, unless loop is True.
+    """
+
+    def __init__(self, values, loop=False):
+        self.values = list(values)
+        if len(self.values) == 0:
+            raise ValueError("ScriptedStream needs at least one value")
+        self.loop = loop
+        self.index = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            value = self.values[self.index]
+            if self.index < len(self.values) - 1:
+                self.index += 1
+            elif self.loop:
+                self.index = 0
+        return value
+
+    def __getstate__(self):
+        # picklable for the sensory subprocess, which gets its own copy
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class SimServos():
+    """
+    robot_hat.Robot like servo group
+    """
+
+    STEP_TIME = 10 # ms, same as robot_hat
+
+    def __init__(self, backend, pin_list, name, init_angles=None, init_order=None):
+        self.backend = backend
+        self.pin_list = list(pin_list)
+        self.pin_num = len(self.pin_list)
+        self.name = name
+        self.offset = [0] * self.pin_num
+        self.max_dps = 428
+        if init_angles is None:
+            init_angles = [0] * self.pin_num
+        self.servo_positions = list(init_angles)
+        self.servo_write_all(self.servo_positions)
+
+    def set_offset(self, offset_list):
+        self.offset = list(offset_list)
+
+    def servo_write_raw(self, angle_list):
+        self.backend.record_servo(self.name, self.pin_list, angle_list)
+
+    def servo_write_all(self, angles):
+        self.servo_write_raw([angles[i] + self.offset[i] for i in range(self.pin_num)])
+
+    def servo_move(self, targets, speed=50, bpm=None):
+        """
+        Move to targets with the timing of robot_hat.Robot.servo_move,
+        the move is recorded once with its duration
+        """
+        speed = min(100, max(0, speed))
+        max_delta = max(abs(targets[i] - self.servo_positions[i]) for i in range(self.pin_num))
+        if max_delta == 0:
+            self.backend.sleep(self.STEP_TIME / 1000)
+            return
+        if bpm:
+            total_time = 60 / bpm * 1000
+        else:
+            total_time = -9.9 * speed + 1000
+        if max_delta / total_time * 1000 > self.max_dps:
+            total_time = max_delta / self.max_dps * 1000
+        total_time = max(total_time, self.STEP_TIME)
+
+        self.servo_positions = list(targets)
+        self.servo_write_all(self.servo_positions)
+        self.backend.sleep(total_time / 1000)
+
+    def reset(self, angles=None):
+        if angles is None:
+            angles = [0] * self.pin_num
+        self.servo_positions = list(angles)
+        self.servo_write_all(self.servo_positions)
+
+
+class SimServoFrameWriter(ServoFrameWriter):
+    """
+    ServoFrameWriter on the simulated i2c bus, also logs the servo angles
+    """
+
+    def __init__(self, backend, auto_increment=True):
+        super().__init__(lambda reg, data: backend.record_i2c(backend.PWM_ADDRESS, reg, data),
+                         auto_increment)
+        self.backend = backend
+
+    def __call__(self, frame):
+        super().__call__(frame)
+        for group, positions in frame:
+            self.backend.record_servo(group.servos.name, group.servos.pin_list, positions)
+
+
+class SimImu():
+    """
+    Sh3001 like imu, plays back (accData, gyroData) raw samples
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def _sh3001_getimudata(self):
+        acc, gyro = self.stream.next()
+        return list(acc), list(gyro)
+
+
+class SimI2CBus():
+    """
+    smbus.SMBus like bus, records all writes
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def write_byte_data(self, addr, reg, value):
+        self.backend.record_i2c(addr, reg, [value])
+
+    def write_i2c_block_data(self, addr, reg, data):
+        self.backend.record_i2c(addr, reg, list(data))
+
+    def read_byte_data(self, addr, reg):
+        return 0
+
+    def read_i2c_block_data(self, addr, reg, length):
+        return [0] * length
+
+
+class SimPin():
+    """
+    robot_hat.Pin like input pin
+    """
+
+    IRQ_FALLING = 0x21
+    IRQ_RISING = 0x11
+    IRQ_RISING_FALLING = 0x31
+
+    def __init__(self, read_func):
+        self._read_func = read_func
+        self.handler = None
+        self.trigger = None
+
+    def value(self, value=None):
+        return self._read_func()
+
+    def irq(self, handler=None, trigger=None, bouncetime=200, pull=None):
+        self.handler = handler
+        self.trigger = trigger
+
+    def edge(self, level):
+        """
+        Fire the irq handler for an edge to level
+        """
+        if self.handler is None:
+            return
+        if self.trigger == self.IRQ_RISING_FALLING or\
+            (self.trigger == self.IRQ_RISING and level) or\
+            (self.trigger == self.IRQ_FALLING and not level):
+            self.handler(self)
+
+
+class SimTouchPanel():
+    """
+    Two touch pins fed by one stream of 'N', 'L', 'R' or 'LR' values
+
+    DualTouch reads the left pin first, so a read of the left pin advances
+    the stream and the right pin reports the same sample. Once irqs are
+    set, the pins stop reading the stream and follow touch() instead.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.current = 'N'
+        self.pin_L = SimPin(self._read_left)
+        self.pin_R = SimPin(self._read_right)
+
+    def _read_left(self):
+        if self.pin_L.handler is None:
+            self.current = self.stream.next()
+        return int('L' in self.current)
+
+    def _read_right(self):
+        return int('R' in self.current)
+
+    def touch(self, state):
+        """
+        Set the touched pads, 'N', 'L', 'R' or 'LR', firing the edges
+        """
+        last, self.current = self.current, state
+        for side, pin in (('L', self.pin_L), ('R', self.pin_R)):
+            if (side in last) != (side in state):
+                pin.edge(int(side in state))
+
+
+class SimSoundSensor():
+    """
+    Busy pin and spi of the sound direction module, fed by a stream of angles,
+    None for no sound detected
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = None
+        self.when_deactivated = None
+
+    @property
+    def value(self):
+        # busy line, low when a direction is ready
+        if self.pending is None:
+            self.pending = self.stream.next()
+        return 1 if self.pending is None else 0
+
+    def xfer2(self, data, speed_hz=0, delay_usec=0):
+        angle, self.pending = self.pending, None
+        if angle is None:
+            return [0, 0, 0, 0, 0, 255]
+        # inverse of the zero conversion in SoundDirection.read
+        val = (360 + 160 - angle) % 360
+        return [0, 0, 0, 0, val & 0xff, val >> 8]
+
+    def detect(self, angle):
+        """
+        Detect a sound at angle: busy goes low, firing the edge callback
+        """
+        self.pending = angle
+        if self.when_deactivated is not None:
+            self.when_deactivated()
+
+
+class SimMusic():
+    """
+    robot_hat.Music like player, records what is played
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def sound_play(self, filename, volume=None):
+        self.backend.record_sound(filename, volume, True)
+
+    def sound_play_threading(self, filename, volume=None):
+        self.backend.record_sound(filename, volume, False)
+
+
+class SimSound():
+    """
+    pygame.mixer.Sound like clip
+    """
+
+    def __init__(self, filename, length):
+        self.filename = filename
+        self.length = length
+
+    def get_length(self):
+        return self.length
+
+
+class SimChannel():
+    """
+    pygame.mixer.Channel like channel, records what is played
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.volume = 1.0
+        self.sound = None
+        self.end_time = 0
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def play(self, sound):
+        self.sound = sound
+        self.end_time = self.backend.time() + sound.get_length()
+        self.backend.record_sound(sound.filename, round(self.volume * 100), False)
+
+    def stop(self):
+        self.sound = None
+        self.end_time = 0
+
+    def get_busy(self):
+        return self.sound is not None and self.backend.time() < self.end_time
+
+
+class SimMixer():
+    """
+    pygame.mixer like module, every clip lasts SOUND_LENGTH
+    """
+
+    SOUND_LENGTH = 0.5 # seconds
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._init = None
+        self.channels = []
+        self.reserved = 0
+        self.decoded = 0 # number of clips decoded
+
+    def init(self, frequency=44100, size=-16, channels=2, buffer=512):
+        self._init = (frequency, size, channels)
+
+    def get_init(self):
+        return self._init
+
+    def quit(self):
+        self._init = None
+
+    def set_num_channels(self, count):
+        self.channels = [SimChannel(self.backend) for _ in range(count)]
+
+    def set_reserved(self, count):
+        self.reserved = count
+
+    def Channel(self, id):
+        return self.channels[id]
+
+    def find_channel(self, force=False):
+        free = self.channels[self.reserved:]
+        for channel in free:
+            if not channel.get_busy():
+                return channel
+        if not force:
+            return None
+        # the one playing for the longest time
+        return min(free, key=lambda channel: channel.end_time)
+
+    def Sound(self, filename):
+        self.decoded += 1
+        return SimSound(filename, self.SOUND_LENGTH)
+
+    def stop(self):
+        for channel in self.channels:
+            channel.stop()
+
+
+class SimUltrasonic():
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, times=10):
+        return self.stream.next()
+
+
+class SimBackend(Backend):
+    """
+    Deterministic simulated hardware
+    """
+
+    # raw imu sample of the robot standing still, (accData, gyroData)
+    IMU_STILL = ([-16384, 0, 0], [0, 0, 0])
+    PWM_ADDRESS = 0x14
+
+    def __init__(self, imu_stream=None, distance_stream=None, touch_stream=None,
+                 sound_direction_stream=None, battery_voltage=7.6, speedup=1.0, loop=False):
+        """
+        :param imu_stream: raw imu samples, list of (accData, gyroData)
+        :type imu_stream: list
+        :param distance_stream: ultrasonic distances, cm, -1 for timeout
+        :type distance_stream: list
+        :param touch_stream: touch states, 'N', 'L', 'R' or 'LR'
+        :type touch_stream: list
+        :param sound_direction_stream: sound directions, degrees, None for no sound
+        :type sound_direction_stream: list
+        :param battery_voltage: battery voltage
+        :type battery_voltage: float
+        :param speedup: run the simulated servo moves this many times faster than real time
+        :type speedup: float or int
+        :param loop: restart the streams when they run out, instead of holding the last value
+        :type loop: bool
+        """
+        if speedup <= 0:
+            raise ValueError("speedup must be greater than 0")
+        self.speedup = speedup
+        self._t0 = monotonic()
+
+        self.imu_stream = ScriptedStream(imu_stream or [self.IMU_STILL], loop)
+        self.distance_stream = ScriptedStream(distance_stream or [-1.0], loop)
+        self.touch_stream = ScriptedStream(touch_stream or ['N'], loop)
+        self.touch_panel = None
+        self.sound_sensor = None
+        self.sound_direction_stream = ScriptedStream(sound_direction_stream or [None], loop)
+        self._battery_voltage = battery_voltage
+
+        # records, list of tuples starting with the timestamp
+        self.servo_log = [] # (time, name, pins, angles)
+        self.i2c_log = [] # (time, addr, reg, data)
+        self.sound_log = [] # (time, filename, volume, blocking)
+        self.command_log = [] # (time, cmd)
+
+    def __getstate__(self):
+        # touch panel and sound sensor hold irq handlers, the sensory
+        # subprocess does not need them
+        state = self.__dict__.copy()
+        state['touch_panel'] = None
+        state['sound_sensor'] = None
+        return state
+
+    # clock
+    def time(self):
+        return (monotonic() - self._t0) * self.speedup
+
+    def sleep(self, seconds):
+        sleep(seconds / self.speedup)
+
+    # records
+    def record_servo(self, name, pins, angles):
+        self.servo_log.append((self.time(), name, list(pins), list(angles)))
+
+    def record_i2c(self, addr, reg, data):
+        self.i2c_log.append((self.time(), addr, reg, data))
+
+    def record_sound(self, filename, volume, blocking):
+        self.sound_log.append((self.time(), filename, volume, blocking))
+
+    # devices
+    def reset_mcu(self):
+        pass
+
+    def servos(self, pin_list, name, init_angles, init_order=None, db=None):
+        return SimServos(self, pin_list, name, init_angles, init_order)
+
+    def servo_frame_writer(self):
+        return SimServoFrameWriter(self)
+
+    def imu(self, db=None):
+        return SimImu(self.imu_stream)
+
+    def rgb_strip(self, addr=0x74, nums=11):
+        return RGBStrip(addr=addr, nums=nums, bus=SimI2CBus(self))
+
+    def dual_touch(self, sw1='D2', sw2='D3'):
+        self.touch_panel = SimTouchPanel(self.touch_stream)
+        return DualTouch(self.touch_panel.pin_L, self.touch_panel.pin_R, clock=self.time)
+
+    def touch(self, state):
+        """
+        Touch the pads of the last created dual touch, 'N', 'L', 'R' or 'LR'
+        """
+        self.touch_panel.touch(state)
+
+    def sound_direction(self):
+        self.sound_sensor = SimSoundSensor(self.sound_direction_stream)
+        return SoundDirection(spi=self.sound_sensor, busy=self.sound_sensor, clock=self.time)
+
+    def sound(self, angle):
+        """
+        Make a sound at angle, degrees, for the last created sound direction
+        """
+        self.sound_sensor.detect(angle)
+
+    def music(self):
+        return SimMusic(self)
+
+    def audio_mixer(self):
+        return SimMixer(self)
+
+    def ultrasonic(self, trig='D1', echo='D0', timeout=0.017):
+        return SimUltrasonic(self.distance_stream)
+
+    def battery_voltage(self):
+        return self._battery_voltage
+
+    def run_command(self, cmd):
+        self.command_log.append((self.time(), cmd))
+        return 0, ''
@@ -28,22 +28,156 @@
     And accept 16bit data, after the acceptance is completed, the main control pulls up the busy line and detects the direction again.
 
 '''
-
-import spidev
-from gpiozero import OutputDevice, InputDevice
+import time
+import queue
+import threading
+from collections import deque
 
 
 class SoundDirection():
+    """
+    Sound direction module
+
+    Polled with isdetected() and read() by default. After enable_events(),
+    the falling edge of the busy line triggers the spi read at once: the
+    (time, angle) readings go to history, to the subscriber queues and
+    callbacks, and wake up wait(). isdetected() and read() then report the
+    last reading not read yet.
+    """
     CS_DELAY_US = 500  # Mhz
     CLOCK_SPEED = 10000000  # 10 MHz
-
-    def __init__(self, busy_pin=6):
-        self.spi = spidev.SpiDev()
-        self.spi.open(0, 0)
+    HISTORY_SIZE = 32 # readings kept in history
+
+    def __init__(self, busy_pin=6, spi=None, busy=None, clock=time.time):
+        """
+        :param busy_pin: busy pin (BCM)
+        :param spi: spidev.SpiDev like object, default SpiDev on bus 0, device 0
+        :param busy: gpiozero.DigitalInputDevice like object, default DigitalInputDevice(busy_pin)
+        :param clock: time function of the timestamps, seconds, eg. the backend clock
+        :type clock: function
+        """
+        self.clock = clock
+        if spi is None:
+            import spidev
+            spi = spidev.SpiDev()
+            spi.open(0, 0)
+        self.spi = spi
         #
-        self.busy = InputDevice(busy_pin, pull_up=False)
+        if busy is None:
+            # DigitalInputDevice: InputDevice with edge callbacks
+            from gpiozero import DigitalInputDevice
+            busy = DigitalInputDevice(busy_pin, pull_up=False)
+        self.busy = busy
+        self.on_read = None # called with each direction read, eg. to publish it
+
+        # busy line events
+        self.events_enabled = False
+        self.spi_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.history = deque(maxlen=self.HISTORY_SIZE) # (time, angle)
+        self.count = 0 # number of readings from events
+        self._latched = None
+        self._subscribers = []
+        self._callbacks = []
+
+    def enable_events(self):
+        """
+        Read the direction on the falling edge of the busy line
+        """
+        if not hasattr(self.busy, 'when_deactivated'):
+            raise ValueError("busy pin does not support edge callbacks")
+        self.events_enabled = True
+        self.busy.when_deactivated = self._on_busy_low
+
+    def _on_busy_low(self, *args):
+        t = self.clock()
+        with self.spi_lock:
+            val = self._read()
+        if val == -1:
+            return
+        with self.cond:
+            self.history.append((t, val))
+            self.count += 1
+            self._latched = val
+            subscribers = list(self._subscribers)
+            callbacks = list(self._callbacks)
+            self.cond.notify_all()
+        if self.on_read is not None:
+            self.on_read(val)
+        for q in subscribers:
+            try:
+                q.put_nowait((t, val))
+            except queue.Full:
+                pass
+        for callback in callbacks:
+            callback(t, val)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the next direction, needs enable_events()
+
+        :param timeout: seconds, None to wait forever
+        :type timeout: float or int
+        :return: (time, angle), None on timeout
+        :rtype: tuple
+        """
+        with self.cond:
+            count = self.count
+            if not self.cond.wait_for(lambda: self.count != count, timeout):
+                return None
+            return self.history[-1]
+
+    def last(self):
+        """
+        :return: the last (time, angle) from events, None if none yet
+        :rtype: tuple
+        """
+        with self.cond:
+            return self.history[-1] if self.history else None
+
+    def subscribe(self, maxsize=0):
+        """
+        Get the directions in a queue, as (time, angle) tuples
+
+        :param maxsize: queue size, 0 for unlimited, readings are dropped when full
+        :type maxsize: int
+        :return: queue
+        :rtype: queue.Queue
+        """
+        q = queue.Queue(maxsize)
+        with self.cond:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.cond:
+            self._subscribers.remove(q)
+
+    def add_callback(self, callback):
+        """
+        Call callback(time, angle) on each direction, from the gpio thread,
+        it should return quickly
+        """
+        with self.cond:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        with self.cond:
+            self._callbacks.remove(callback)
 
     def read(self):
+        if self.events_enabled:
+            # the last direction not read yet
+            with self.cond:
+                val, self._latched = self._latched, None
+            return -1 if val is None else val
+        with self.spi_lock:
+            val = self._read()
+        if self.on_read is not None:
+            self.on_read(val)
+        return val
+
+    def _read(self):
         result = self.spi.xfer2([0, 0, 0, 0, 0, 0], self.CLOCK_SPEED,
                                 self.CS_DELAY_US)
 
@@ -58,6 +192,8 @@ class SoundDirection():
             return val
 
     def isdetected(self):
+        if self.events_enabled:
+            return self._latched is not None
         return self.busy.value == 0
 
 
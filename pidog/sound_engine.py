@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+'''
+Low latency sound effects
+
+The sound folder is indexed once, clips are decoded once into memory
+(pygame.mixer.Sound holds the pcm samples) and kept in an LRU cache with a
+byte budget. The mixer is opened once with a short buffer and stays open,
+so a sound starts within one buffer period (BUFFER / FREQUENCY, 11.6 ms)
+instead of after a shell command, a few file lookups and a decode.
+
+Sounds are mixed on a pool of channels. One channel is reserved for the
+voice: playing with interrupt=True stops what the voice is saying and
+starts the new sound on it right away.
+'''
+import os
+import threading
+from time import sleep
+from collections import OrderedDict
+
+
+class SoundEngine():
+    """
+    Sound effects player with an index of the sound folder and a cache of
+    decoded clips
+    """
+
+    FREQUENCY = 44100 # Hz
+    SIZE = -16 # signed 16 bits samples
+    CHANNELS = 2 # stereo
+    BUFFER = 512 # samples per buffer, the playback latency
+    NUM_CHANNELS = 8 # sounds played at the same time
+    VOICE_CHANNEL = 0 # reserved for interrupting sounds
+    EXTENSIONS = ('.mp3', '.wav') # by order of preference
+    CACHE_BYTES = 32 * 1024 * 1024 # memory budget of the decoded clips
+
+    def __init__(self, mixer, sound_dir, run_command=None, sleep=sleep, cache_bytes=CACHE_BYTES):
+        """
+        :param mixer: pygame.mixer like module
+        :param sound_dir: folder of the sound files
+        :type sound_dir: str
+        :param run_command: function running a shell command, to stop pulseaudio once
+        :type run_command: function
+        :param sleep: sleep function, seconds
+        :type sleep: function
+        :param cache_bytes: memory budget of the decoded clips, bytes
+        :type cache_bytes: int
+        """
+        self.mixer = mixer
+        self.sound_dir = sound_dir
+        self.run_command = run_command
+        self.sleep = sleep
+        self.cache_bytes = cache_bytes
+
+        self.lock = threading.Lock()
+        self.index = {} # name -> path
+        self._cache = OrderedDict() # path -> (sound, bytes)
+        self.cached_bytes = 0
+        self.voice = None
+        self.opened = False
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.reindex()
+
+    def reindex(self):
+        """
+        Index the sound folder, call it after adding sound files
+        """
+        index = {}
+        try:
+            entries = sorted(os.scandir(self.sound_dir), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            name, ext = os.path.splitext(entry.name)
+            if ext.lower() not in self.EXTENSIONS or not entry.is_file():
+                continue
+            if name in index and self.EXTENSIONS.index(os.path.splitext(index[name])[1].lower()) \
+                    <= self.EXTENSIONS.index(ext.lower()):
+                continue
+            index[name] = entry.path
+        with self.lock:
+            self.index = index
+
+    def open(self):
+        """
+        Open the mixer, once
+        """
+        with self.lock:
+            if self.opened:
+                return
+            if self.run_command is not None:
+                # Solve the problem that there is no sound when running in the vnc environment
+                self.run_command('sudo killall pulseaudio')
+            if not self.mixer.get_init():
+                self.mixer.init(frequency=self.FREQUENCY, size=self.SIZE,
+                                channels=self.CHANNELS, buffer=self.BUFFER)
+            self.mixer.set_num_channels(self.NUM_CHANNELS)
+            self.mixer.set_reserved(self.VOICE_CHANNEL + 1)
+            self.voice = self.mixer.Channel(self.VOICE_CHANNEL)
+            self.opened = True
+
+    def close(self):
+        with self.lock:
+            if self.opened:
+                self.mixer.stop()
+                self.mixer.quit()
+                self.opened = False
+            self._cache.clear()
+            self.cached_bytes = 0
+
+    def find(self, name):
+        """
+        :param name: sound name in the sound folder, or file path
+        :type name: str
+        :return: file path, None if not found
+        :rtype: str
+        """
+        path = self.index.get(name)
+        if path is None and os.path.isfile(name):
+            path = name
+        return path
+
+    def _sound_bytes(self, sound):
+        frequency, size, channels = self.mixer.get_init()
+        return int(sound.get_length() * frequency * channels * abs(size) // 8)
+
+    def load(self, name):
+        """
+        Decoded clip of a sound, from the cache or decoded now
+
+        :param name: sound name in the sound folder, or file path
+        :type name: str
+        :return: pygame.mixer.Sound like object, None if not found
+        """
+        path = self.find(name)
+        if path is None:
+            return None
+        self.open()
+        with self.lock:
+            if path in self._cache:
+                self._cache.move_to_end(path)
+                self.hits += 1
+                return self._cache[path][0]
+            self.misses += 1
+        sound = self.mixer.Sound(path)
+        size = self._sound_bytes(sound)
+        if size > self.cache_bytes:
+            # too big to keep, play it once
+            return sound
+        with self.lock:
+            if path not in self._cache:
+                self._cache[path] = (sound, size)
+                self.cached_bytes += size
+                while self.cached_bytes > self.cache_bytes:
+                    _, (_, evicted) = self._cache.popitem(last=False)
+                    self.cached_bytes -= evicted
+                    self.evictions += 1
+        return sound
+
+    def preload(self, names):
+        """
+        Decode sounds ahead of their first play
+
+        :param names: sound names
+        :type names: list
+        """
+        for name in names:
+            self.load(name)
+
+    def play(self, name, volume=100, interrupt=False, block=False):
+        """
+        Play a sound
+
+        :param name: sound name in the sound folder, or file path
+        :type name: str
+        :param volume: volume, 0-100
+        :type volume: int
+        :param interrupt: stop the voice channel and play on it, otherwise
+            mix with the sounds playing
+        :type interrupt: bool
+        :param block: wait until the sound finished
+        :type block: bool
+        :return: length of the sound, seconds, None if not found
+        :rtype: float
+        """
+        sound = self.load(name)
+        if sound is None:
+            return None
+        if interrupt:
+            channel = self.voice
+            channel.stop()
+        else:
+            # the oldest sound is cut when all channels are busy
+            channel = self.mixer.find_channel(True)
+        channel.set_volume(max(0, min(100, volume)) / 100)
+        channel.play(sound)
+        length = sound.get_length()
+        if block:
+            self.sleep(length)
+        return length
+
+    def stop(self):
+        """
+        Stop all sounds
+        """
+        if self.opened:
+            self.mixer.stop()
+
+    def stats(self):
+        """
+        :return: indexed sounds, cached clips and bytes, cache hits, misses and evictions
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'indexed': len(self.index),
+                'cached': len(self._cache),
+                'cached_bytes': self.cached_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
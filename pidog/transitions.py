@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+'''
+Blend trajectories between legs poses
+
+Going from one action to another used to mean waiting for the first one to
+finish and jumping to the first frame of the next one. TransitionBlender
+computes a short smooth trajectory between any two legs frames (a pose, or
+a frame of a gait table), either in joint space (servo angles eased from one
+frame to the other) or in foot space (feet moved on straight lines, angles
+solved back with the inverse kinematics), and caches it per (from, to) pair.
+
+The blend frames are Keyframe objects carrying their own speed, so that the
+whole blend takes the time of a single keyframe at the speed of the action,
+see TransitionBlender.keyframes.
+'''
+import threading
+from math import ceil, pi
+from collections import OrderedDict
+import numpy as np
+
+
+class Keyframe(list):
+    """
+    Frame of angles moved at its own speed instead of the speed of its part,
+    a plain list for everything else
+    """
+
+    def __init__(self, angles, speed):
+        """
+        :param angles: servo angles
+        :type angles: list
+        :param speed: speed of this frame, 0-100
+        :type speed: float or int
+        """
+        super().__init__(angles)
+        self.speed = speed
+
+
+class TransitionBlender():
+    """
+    Smooth, cached legs trajectories between two frames
+    """
+
+    LEG = 42
+    FOOT = 76
+    MAX_STEP = 8 # degrees, max servo move between two frames of a joint blend
+    CACHE_SIZE = 32 # max number of trajectories kept in cache
+    SPACES = ('joint', 'foot')
+
+    def __init__(self, leg=LEG, foot=FOOT, ik=None, max_step=MAX_STEP):
+        """
+        :param leg: upper leg length, mm
+        :param foot: lower leg length, mm
+        :param ik: function solving feet coordinates (N * 4 * [y, z]) to
+            angles (N * 8), default Pidog.legs_angle_calculation_batch
+        :type ik: function
+        :param max_step: max servo move between two frames, degrees
+        :type max_step: float or int
+        """
+        if ik is None:
+            from .pidog import Pidog
+            ik = Pidog.legs_angle_calculation_batch
+        self.leg = leg
+        self.foot = foot
+        self.ik = ik
+        self.max_step = max_step
+        self.lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def feet(self, angles):
+        """
+        Forward kinematics, inverse of Pidog.legs_angle_calculation
+
+        :param angles: legs frames, N * 8 angles, or one frame
+        :type angles: list or numpy.ndarray
+        :return: feet coordinates, N * 4 * [y, z]
+        :rtype: numpy.ndarray, shape (N, 4, 2)
+        """
+        angles = np.asarray(angles, dtype=float).reshape(-1, 4, 2).copy()
+        # The left and right sides are opposite
+        angles[:, 1::2] *= -1
+        alpha = angles[..., 0] / 180 * pi
+        beta = (angles[..., 1] + 90) / 180 * pi
+        leg, foot = self.leg, self.foot
+        u = np.sqrt(foot**2 + leg**2 - 2 * foot * leg * np.cos(beta))
+        cos_angle2 = (leg**2 + u**2 - foot**2) / (2 * leg * u)
+        angle1 = alpha - np.arccos(np.clip(cos_angle2, -1, 1))
+        return np.stack([u * np.sin(angle1), u * np.cos(angle1)], axis=-1)
+
+    def blend(self, from_angles, to_angles, space='joint', frames=None):
+        """
+        Trajectory from one legs frame to another, both excluded
+
+        :param from_angles: start frame, 8 angles
+        :type from_angles: list
+        :param to_angles: end frame, 8 angles
+        :type to_angles: list
+        :param space: 'joint' to ease the angles, 'foot' to move the feet on straight lines
+        :type space: str
+        :param frames: number of frames, default enough for max_step, none
+            if the frames are closer than max_step
+        :type frames: int
+        :return: frames, read-only, shared with the cache
+        :rtype: numpy.ndarray, shape (frames, 8)
+        """
+        if space not in self.SPACES:
+            raise ValueError(f"space must be one of {self.SPACES}")
+        start = np.round(np.asarray(from_angles, dtype=float), 1)
+        end = np.round(np.asarray(to_angles, dtype=float), 1)
+        key = (space, tuple(start), tuple(end), frames)
+        with self.lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        if frames is None:
+            delta = np.abs(end - start).max()
+            # the smoothstep moves up to 1.5 times the mean step
+            frames = max(0, int(ceil(1.5 * delta / self.max_step)) - 1)
+        # smoothstep easing, zero speed at both ends
+        s = np.arange(1, frames + 1) / (frames + 1)
+        s = (s * s * (3 - 2 * s))[:, None]
+        if space == 'joint':
+            data = start + (end - start) * s
+        else:
+            feet = self.feet(np.stack([start, end]))
+            path = feet[0] + (feet[1] - feet[0]) * s[:, :, None]
+            data = np.asarray(self.ik(path), dtype=float)
+        data.setflags(write=False)
+
+        with self.lock:
+            self._cache[key] = data
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return data
+
+    @staticmethod
+    def frame_speed(speed, moves):
+        """
+        Speed of each one of moves keyframes, so that together they take the
+        time of one keyframe at speed (1000 - 9.9 * speed ms, the timing of
+        robot_hat.Robot.servo_move), at most 100
+
+        :param speed: speed of the action, 0-100
+        :type speed: float or int
+        :param moves: number of keyframes
+        :type moves: int
+        :rtype: float
+        """
+        total_time = -9.9 * min(100, max(0, speed)) + 1000
+        return min(100, (1000 - total_time / moves) / 9.9)
+
+    def keyframes(self, from_angles, to_angles, speed, space='joint', frames=None):
+        """
+        The blend and the end frame, timed to take one keyframe at speed altogether
+
+        :param speed: speed of the action, 0-100
+        :type speed: float or int
+        :return: frames, to_angles last
+        :rtype: list of Keyframe
+        """
+        path = self.blend(from_angles, to_angles, space, frames).tolist()
+        path.append(list(to_angles))
+        frame_speed = self.frame_speed(speed, len(path))
+        return [Keyframe(angles, frame_speed) for angles in path]
+
+    def clear_cache(self):
+        with self.lock:
+            self._cache.clear()
+
+    def stats(self):
+        """
+        :return: cached trajectories, cache hits and misses
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'cached': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
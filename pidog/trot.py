@@ -16,7 +16,6 @@ every SECTION devide into 4 STEPs
 
 #!/usr/bin/env python3
 
-import readchar
 from time import sleep as delay
 from math import cos, pi
 
@@ -129,6 +128,7 @@ class Trot():
 
 def test():
 
+    import readchar
     from pidog import Pidog
     dog = Pidog(leg_pins=[1, 2, 3, 4, 5, 6, 7, 8],
                 head_pins=[9, 10, 11], tail_pin=[12],
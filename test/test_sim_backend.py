@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+'''
+Pidog on the simulated backend, no robot needed:
+
+    python3 -m unittest discover -s test -p "test_*.py"
+'''
+import os
+import sys
+import unittest
+from time import sleep, monotonic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pidog import Pidog
+from pidog.sim_backend import SimBackend
+
+
+def wait_for(condition, timeout):
+    # real time
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
+class SimBackendTest(unittest.TestCase):
+
+    SPEEDUP = 20
+    # biased raw imu samples, the calibration removes the bias
+    IMU_RAW = ([-16000, 100, 50], [10, -20, 30])
+    DISTANCE = 50.0
+
+    def setUp(self):
+        self.sim = SimBackend(imu_stream=[self.IMU_RAW], distance_stream=[self.DISTANCE],
+                              speedup=self.SPEEDUP)
+        self.dog = Pidog(backend=self.sim)
+
+    def tearDown(self):
+        self.dog.sensory_worker.stop()
+        self.dog.close_all_thread()
+        self.dog.sensor_bus.close()
+
+    def test_gait(self):
+        frames, part = self.dog.actions_dict['forward']
+        self.assertEqual(part, 'legs')
+        self.dog.do_action('forward', step_count=2, speed=98)
+        self.assertTrue(self.dog.wait_legs_done(timeout=30))
+        self.assertEqual(self.dog.leg_current_angles, frames[-1])
+        # every frame reached the simulated servos
+        legs = [entry for entry in self.sim.servo_log if entry[1] == 'legs']
+        self.assertGreaterEqual(len(legs), 2 * len(frames))
+        self.assertEqual(list(legs[-1][3]), frames[-1])
+
+    def test_imu(self):
+        # ten calibration samples on the backend clock, then offset corrected readings
+        self.assertTrue(wait_for(lambda: self.dog.accData == [-16384, 0, 0], 0.5))
+        self.assertEqual(self.dog.gyroData, [0, 0, 0])
+        self.assertAlmostEqual(self.dog.pitch, 0, places=3)
+        self.assertAlmostEqual(self.dog.roll, 0, places=3)
+
+    def test_distance(self):
+        self.assertTrue(wait_for(lambda: self.dog.read_distance() == self.DISTANCE, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()